@@ -2,13 +2,21 @@ from datetime import datetime, timedelta, timezone
 
 import disnake
 from disnake.ext import commands, tasks
-from PIL import Image
 
 from main import tracked_templates
-from utils.discord_utils import image_to_file
+from utils.discord_utils import png_to_file
 from utils.log import get_logger
-from utils.setup import db_servers, db_stats, db_templates, db_users, stats, ws_client
+from utils.setup import (
+    db_servers,
+    db_snapshots,
+    db_stats,
+    db_templates,
+    db_users,
+    stats,
+    ws_client,
+)
 from utils.time_converter import local_to_utc
+from utils.utils import in_executor
 
 logger = get_logger("clock")
 
@@ -22,10 +30,12 @@ class Clock(commands.Cog):
         self.bot: commands.Bot = bot
         self.update_stats.start()
         self.update_online_count.start()
+        self.check_grief_alerts.start()
 
     def cog_unload(self):
         self.update_stats.cancel()
         self.update_online_count.cancel()
+        self.check_grief_alerts.cancel()
 
     @tasks.loop(seconds=60)
     async def update_stats(self):
@@ -115,18 +125,15 @@ class Clock(commands.Cog):
             record_id = None
             logger.warning("Stats page unreachable.")
 
-        ws_client.pause()
         # update the board
         try:
             await self.update_boards()
             logger.debug("Boards updated.")
         except ValueError as e:
             logger.error(f"Couldn't update boards: {e}")
-            ws_client.resume()
             return
         except Exception:
             logger.exception("Couldn't update boards:")
-            ws_client.resume()
             return
 
         # save the color stats
@@ -137,7 +144,16 @@ class Clock(commands.Cog):
             except Exception:
                 logger.exception("Couldn't save color stats:")
 
-        ws_client.resume()
+        # save the board snapshot locally
+        try:
+            await db_snapshots.save_board_snapshot(
+                datetime.utcnow().replace(microsecond=0),
+                await stats.get_canvas_code(),
+                stats.board_array,
+            )
+            logger.debug("Board snapshot saved.")
+        except Exception:
+            logger.exception("Couldn't save the board snapshot:")
 
         # send snapshots
         try:
@@ -165,6 +181,9 @@ class Clock(commands.Cog):
         try:
             await self.save_online_count()
             logger.debug("Online count saved.")
+            logger.debug(
+                f"Websocket throughput: {round(ws_client.get_throughput(), 1)} pixels/s"
+            )
 
         except Exception:
             logger.exception("Unexpected exception in task 'save_online_count'")
@@ -198,6 +217,62 @@ class Clock(commands.Cog):
         ) + timedelta(minutes=time_interval)
         await disnake.utils.sleep_until(next_run)
 
+    @tasks.loop(seconds=60)
+    async def check_grief_alerts(self):
+        try:
+            await self.send_grief_alerts()
+        except Exception:
+            logger.exception("Unexpected exception in task 'check_grief_alerts'")
+
+    @check_grief_alerts.before_loop
+    async def before_check_grief_alerts(self):
+        await self.bot.wait_until_ready()
+
+    async def send_grief_alerts(self):
+        """Send an alert in the channels following a template if it's being griefed."""
+        detector = tracked_templates.grief_detector
+        alerts = detector.get_alerts(tracked_templates.list[:])
+        for template, nb_griefed in alerts:
+            channels = await db_templates.get_template_alert_channels(template)
+            if not channels:
+                continue
+            _, xs, ys, _ = detector.get_griefed_pixels(template, detector.window)
+            description = "**{}** pixels were griefed in the last {} minutes.".format(
+                nb_griefed, round(detector.window / 60)
+            )
+            if len(xs):
+                description += f"\nLast griefed pixel: ({xs[-1]}, {ys[-1]})"
+            embed = disnake.Embed(
+                title=f"⚠️ `{template.name}` is being griefed!",
+                description=description,
+                color=0xFFCC00,
+                url=template.url,
+            )
+            embed.add_field(
+                name="Progress",
+                value=f"{template.current_progress}/{template.total_placeable}",
+            )
+            embed.timestamp = datetime.now(timezone.utc)
+            for channel_id in channels:
+                channel = self.bot.get_channel(int(channel_id))
+                if channel is None:
+                    # the channel was deleted or the bot can't see it anymore
+                    logger.info(
+                        f"Grief alerts of '{template.name}' disabled in channel "
+                        f"{channel_id}: channel not found"
+                    )
+                    await db_templates.delete_template_alert_channel(
+                        template, channel_id
+                    )
+                    continue
+                try:
+                    await channel.send(embed=embed)
+                except Exception:
+                    logger.exception(
+                        f"Couldn't send the grief alert of '{template.name}' "
+                        f"in channel {channel_id}:"
+                    )
+
     async def check_milestones(self):
         """Send alerts in all the servers following a user if they hit a milestone."""
 
@@ -232,8 +307,7 @@ class Clock(commands.Cog):
         if not channels:
             return
         snapshot_saved = False
-        array = stats.palettize_array(stats.board_array)
-        board_img = Image.fromarray(array)
+        board_png = await stats.get_board_png()
         snapshot_time = datetime.now(timezone.utc)
         filename = f"snapshot_{snapshot_time.strftime('%FT%H%M')}.png"
 
@@ -242,7 +316,7 @@ class Clock(commands.Cog):
                 channel = self.bot.get_channel(int(channel_id))
                 embed = disnake.Embed(title="Canvas Snapshot", color=0x66C5CC)
                 embed.timestamp = snapshot_time
-                file = await image_to_file(board_img, filename, embed)
+                file = png_to_file(board_png, filename, embed)
                 m = await channel.send(file=file, embed=embed)
             except Exception:
                 continue
@@ -278,40 +352,20 @@ class Clock(commands.Cog):
         await db_stats.update_all_pxls_stats(alltime_stats, canvas_stats, record_id)
 
     async def save_color_stats(self, record_id):
-        # get the board with the placeable pixels only
-        placeable_board = await stats.get_placable_board()
-        placeable_board_img = Image.fromarray(placeable_board)
-        board_colors = placeable_board_img.getcolors()
-
-        # use the virgin map as a mask to get the board with placed pixels
-        virgin_array = stats.virginmap_array
-        placed_board = placeable_board.copy()
-        placed_board[virgin_array != 0] = 255
-        placed_board[virgin_array == 0] = placeable_board[virgin_array == 0]
-        placed_board_img = Image.fromarray(placed_board)
-        placed_colors = placed_board_img.getcolors()
+        # get the live amount of each color on the placeable pixels
+        # and on the placed pixels only
+        color_counts = stats.get_color_counts()
+        if color_counts is None:
+            return
+        amounts, placed_amounts = color_counts
 
         # Make a dictionary with the color index as key and a dictionnary of
         # amount and amount_placed as value
         colors_dict = {}
         for color_index, color in enumerate(stats.get_palette()):
             colors_dict[color_index] = {}
-            colors_dict[color_index]["amount"] = 0
-            colors_dict[color_index]["amount_placed"] = 0
-
-        # add board values
-        for color in board_colors:
-            amount = color[0]
-            color_id = color[1]
-            if color_id in colors_dict:
-                colors_dict[color_id]["amount"] = amount
-
-        # add placed board values
-        for color in placed_colors:
-            amount = color[0]
-            color_id = color[1]
-            if color_id in colors_dict:
-                colors_dict[color_id]["amount_placed"] = amount
+            colors_dict[color_index]["amount"] = int(amounts[color_index])
+            colors_dict[color_index]["amount_placed"] = int(placed_amounts[color_index])
 
         await db_stats.save_color_stats(colors_dict, record_id)
 
@@ -325,6 +379,16 @@ class Clock(commands.Cog):
         await stats.fetch_board()
         await stats.fetch_virginmap()
         await stats.fetch_placemap()
+        # reconcile the local heatmap with the pxls one
+        try:
+            await stats.fetch_heatmap()
+        except Exception as e:
+            logger.warning(f"Couldn't reconcile the heatmap: {e}")
+        # the new board made the progress of the tracked templates outdated:
+        # compute it now so they are kept up to date with the websocket again
+        await in_executor()(tracked_templates.update_all_progress)(
+            tracked_templates.list[:]
+        )
 
     async def update_template_stats(self):
         """Update all the tracked templates"""
@@ -335,10 +399,13 @@ class Clock(commands.Cog):
             if canvas_code is not None and temp.canvas_code != canvas_code:
                 name = temp.name
                 # await db_templates.delete_template(temp)
-                tracked_templates.list.remove(temp)
+                tracked_templates.remove_template(temp)
                 logger.info(f"Template '{name}' deleted. Reason: new canvas code")
-                continue
-            progress = temp.update_progress()
+        # the progress is kept up to date with the websocket pixels, it's only
+        # computed (in one pass on the board) for the new or outdated templates
+        templates = tracked_templates.list[:]
+        progresses = tracked_templates.update_all_progress(templates)
+        for temp, progress in zip(templates, progresses):
             await db_templates.create_template_stat(temp, dt, progress)
         # update the combo and save its progress
         tracked_templates.update_combo(self.bot.user.id, canvas_code)
@@ -3,7 +3,6 @@ import time
 import disnake
 import numpy as np
 from disnake.ext import commands
-from PIL import Image
 
 from utils.arguments_parser import MyParser
 from utils.discord_utils import (
@@ -143,7 +142,7 @@ class Reduce(commands.Cog):
         embed.description += f"**Size**: {total_amount} pixels ({img.width}x{img.height})"
         embed.set_footer(text=f"Reduced in {round((end-start),3)}s")
 
-        reduced_image = Image.fromarray(stats.palettize_array(reduced_array, hex_palette))
+        reduced_image = stats.palettize_image(reduced_array, hex_palette)
         reduced_file = await image_to_file(reduced_image, "reduced.png", embed)
 
         await ctx.send(embed=embed, files=[reduced_file])
@@ -14,6 +14,7 @@ from utils.discord_utils import (
     autocomplete_pxls_name,
     format_number,
     image_to_file,
+    png_to_file,
 )
 from utils.plot_utils import matplotlib_to_plotly
 from utils.pxls.cooldown import get_best_possible
@@ -178,16 +179,21 @@ class PxlsStats(commands.Cog):
         emb.add_field(name="**Canvas Stats**", value=canvas_stats_text, inline=False)
         emb.add_field(name="**Canvas Completion**", value=completion_text, inline=False)
 
+        # warn if the stats couldn't be refreshed because pxls.space is unreachable
+        stale_age = stats.get_stale_age("stats/stats.json")
+        stale_text = ""
+        if stale_age is not None:
+            stale_age = td_format(timedelta(seconds=stale_age), hide_seconds=True)
+            stale_text = f"\n⚠️ pxls.space is unreachable (last reached {stale_age} ago)"
         emb.add_field(
             name="\u200b",
-            value="Last updated: " + format_datetime(last_updated, "R"),
+            value="Last updated: " + format_datetime(last_updated, "R") + stale_text,
             inline=False,
         )
 
         # set the board image as thumbnail
-        board_array = stats.palettize_array(board)
-        board_img = Image.fromarray(board_array)
-        f = await image_to_file(board_img, "board.png")
+        board_png = await stats.get_board_png(max_size=512)
+        f = png_to_file(board_png, "board.png")
         emb.set_thumbnail(url="attachment://board.png")
 
         await ctx.send(embed=emb, file=f)
@@ -501,17 +507,15 @@ class PxlsStats(commands.Cog):
                         "❌ The opacity value must be between 0 and 100."
                     )
 
+        board_png = None
         # virginmap
         if parsed_args.virginmap:
-            array = stats.virginmap_array.copy()
-            array[array == 255] = 1
-            array[stats.placemap_array != 0] = 255
-            array = stats.palettize_array(array, palette=["#000000", "#00DD00"])
+            board_png = await stats.get_board_png("virginmap")
             title = "Canvas Virginmap"
         # heatmap
         elif heatmap_opacity is not None:
             # get the heatmap
-            array = await stats.fetch_heatmap()
+            array = await stats.get_heatmap()
             # invert the values to have the inactive pixels at 255 (which is the default transparent value)
             array = 255 - array
             heatmap_palette = matplotlib_to_plotly("plasma_r", 255)
@@ -522,12 +526,7 @@ class PxlsStats(commands.Cog):
             title = "Canvas Heatmap"
         # non-virgin board
         elif parsed_args.nonvirgin:
-            placeable_board = await stats.get_placable_board()
-            virgin_array = stats.virginmap_array
-            array = placeable_board.copy()
-            array[virgin_array != 0] = 255
-            array[virgin_array == 0] = placeable_board[virgin_array == 0]
-            array = stats.palettize_array(array)
+            board_png = await stats.get_board_png("nonvirgin")
             title = "Current Board (non-virgin pixels)"
         # initial board
         elif parsed_args.initial:
@@ -536,8 +535,7 @@ class PxlsStats(commands.Cog):
             title = "Initial Board"
         # current board
         else:
-            array = stats.board_array
-            array = stats.palettize_array(array)
+            board_png = await stats.get_board_png()
             title = "Current Board"
 
         if heatmap_opacity is not None:
@@ -547,11 +545,14 @@ class PxlsStats(commands.Cog):
             enhancer = ImageEnhance.Brightness(board_img)
             board_img = enhancer.enhance(heatmap_opacity / 100)
             board_img.paste(heatmap_img, (0, 0), heatmap_img)
-        else:
+        elif board_png is None:
             board_img = Image.fromarray(array)
         embed = disnake.Embed(title=title, color=0x66C5CC)
         embed.timestamp = datetime.now(timezone.utc)
-        file = await image_to_file(board_img, "board.png", embed)
+        if board_png is not None:
+            file = png_to_file(board_png, "board.png", embed)
+        else:
+            file = await image_to_file(board_img, "board.png", embed)
         await ctx.send(file=file, embed=embed)
 
     @commands.slash_command(name="canvascolors")
@@ -576,18 +577,14 @@ class PxlsStats(commands.Cog):
 
     async def canvascolors(self, ctx, *options):
         """Show the canvas colors."""
-        # get the board with the placeable pixels only
-        placeable_board = await stats.get_placable_board()
-
         if "-placed" in options or "-p" in options:
-            # use the virgin map as a mask to get the board with placed pixels
-            virgin_array = stats.virginmap_array
-            placed_board = placeable_board.copy()
-            placed_board[virgin_array != 0] = 255
-            placed_board[virgin_array == 0] = placeable_board[virgin_array == 0]
+            # get the board with the placed pixels only
+            placed_board = stats.get_nonvirgin_board()
             img = Image.fromarray(stats.palettize_array(placed_board))
             title = "Canvas colors breakdown (non-virgin pixels only)"
         else:
+            # get the board with the placeable pixels only
+            placeable_board = await stats.get_placable_board()
             img = Image.fromarray(stats.palettize_array(placeable_board))
             title = "Canvas color breakdown"
 
@@ -651,12 +648,12 @@ class PxlsStats(commands.Cog):
         except ValueError as e:
             return await ctx.send(f"❌ {e}")
 
-        # get the board with the placeable pixels only
-        canvas_array_idx = await stats.get_placable_board()
         if parsed_args.placed:
-            # only keep virgin pixels
-            virgin_array = stats.virginmap_array
-            canvas_array_idx[virgin_array != 0] = 255
+            # get the board with the placed pixels only
+            canvas_array_idx = stats.get_nonvirgin_board()
+        else:
+            # get the board with the placeable pixels only
+            canvas_array_idx = await stats.get_placable_board()
         array = stats.palettize_array(canvas_array_idx)
         await _highlight(ctx, array, parsed_args.colors.copy(), parsed_args.bgcolor)
 
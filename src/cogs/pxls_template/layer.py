@@ -4,7 +4,6 @@ import time
 
 import disnake
 from disnake.ext import commands
-from PIL import Image
 
 from main import tracked_templates
 from utils.arguments_parser import MyParser
@@ -66,7 +65,7 @@ class Layer(commands.Cog):
         ox, oy, palettized_array = layer(templates)
         if palettized_array.size == 0:
             return await ctx.send("❌ No placeable pixels in the layered template.")
-        img = Image.fromarray(stats.palettize_array(palettized_array))
+        img = stats.palettize_image(palettized_array)
         end = time.time()
 
         embed = disnake.Embed(color=0x66C5CC, title="Layered")
@@ -1,6 +1,6 @@
 import asyncio
 import time
-from copy import deepcopy
+from copy import copy, deepcopy
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 
@@ -12,6 +12,7 @@ from disnake.ext import commands
 from PIL import Image
 
 from cogs.pxls.speed import get_grouped_graph, get_stats_graph
+from database.db_snapshot_manager import SNAPSHOT_INTERVAL
 from main import tracked_templates
 from utils.arguments_parser import MyParser
 from utils.discord_utils import (
@@ -39,7 +40,14 @@ from utils.pxls.template_manager import (
     make_before_after_gif,
     parse_template,
 )
-from utils.setup import db_stats, db_templates, db_users, imgur_app, stats
+from utils.setup import (
+    db_snapshots,
+    db_stats,
+    db_templates,
+    db_users,
+    imgur_app,
+    stats,
+)
 from utils.table_to_image import table_to_image
 from utils.time_converter import (
     format_datetime,
@@ -182,7 +190,11 @@ class Progress(commands.Cog):
         # get the current template progress stats
         title = template.title or "`N/A`"
         total_placeable = template.total_placeable
-        correct_pixels = template.update_progress()
+        if is_tracked and not isinstance(template, Combo):
+            # (kept up to date with the board changes)
+            correct_pixels = tracked_templates.update_progress(template)
+        else:
+            correct_pixels = template.update_progress()
         if total_placeable == 0:
             raise ValueError(
                 ":x: The template seems to be outside the canvas, make sure it's correctly positioned."
@@ -192,7 +204,7 @@ class Progress(commands.Cog):
 
         # get the image to display
         if display == "template":
-            progress_image = Image.fromarray(template.get_array())
+            progress_image = stats.palettize_image(template.palettized_array)
         elif display == "hltemplate":
             progress_image = await template.get_preview_image(
                 crop_to_template=False, opacity=0.5
@@ -200,49 +212,45 @@ class Progress(commands.Cog):
         elif display == "wrong":
             wrong_pixels = template.palettized_array.copy()
             wrong_pixels[~template.get_wrong_pixels_mask()] = 255
-            progress_image = Image.fromarray(stats.palettize_array(wrong_pixels))
+            progress_image = stats.palettize_image(wrong_pixels)
         elif display == "hlwrong":
             wrong_pixels = template.palettized_array.copy()
             wrong_pixels[~template.get_wrong_pixels_mask()] = 255
-            wrong_pixels = stats.palettize_array(wrong_pixels)
             progress_image = await template.get_preview_image(wrong_pixels)
         elif display == "correct":
             correct_pixels_array = template.palettized_array.copy()
             correct_pixels_array[~template.placed_mask] = 255
-            progress_image = Image.fromarray(stats.palettize_array(correct_pixels_array))
+            progress_image = stats.palettize_image(correct_pixels_array)
         elif display == "hlcorrect":
             correct_pixels_array = template.palettized_array.copy()
             correct_pixels_array[~template.placed_mask] = 255
-            correct_pixels_array = stats.palettize_array(correct_pixels_array)
             progress_image = await template.get_preview_image(correct_pixels_array)
         elif display in ["canvas", "virginmap"]:
             if display == "canvas":
                 board = await stats.get_placable_board()
                 palette = None
             elif display == "virginmap":
-                board = stats.virginmap_array.copy()
-                board[board == 255] = 1
+                board = stats.get_virginmap_layer()
                 palette = ["#000000", "#00FF00"]
             cropped_board = template.crop_array_to_template(board)
             cropped_board[~template.placeable_mask] = 255
-            progress_image = Image.fromarray(
-                stats.palettize_array(cropped_board, palette)
-            )
+            progress_image = stats.palettize_image(cropped_board, palette)
         elif display == "heatmap":
-            heatmap = await stats.fetch_heatmap()
+            heatmap = await stats.get_heatmap()
             heatmap = 255 - heatmap
             palette = matplotlib_to_plotly("plasma_r", 255)
             cropped_heatmap = template.crop_array_to_template(heatmap)
             cropped_heatmap[~template.placeable_mask] = 255
-            cropped_heatmap = stats.palettize_array(cropped_heatmap, palette)
-            progress_image = await template.get_preview_image(cropped_heatmap)
+            progress_image = await template.get_preview_image(
+                cropped_heatmap, palette=palette
+            )
         elif display == "virginabuse":
-            template_virginmap = template.crop_array_to_template(stats.virginmap_array)
+            template_virginmap = template.crop_buffer_to_template(stats.virginmap_buffer)
             board = np.logical_and(template_virginmap, template.placed_mask)
             board.dtype = np.uint8
             board[~template.placeable_mask] = 255
             palette = ["#000000", "#00FF00"]
-            progress_image = Image.fromarray(stats.palettize_array(board, palette))
+            progress_image = stats.palettize_image(board, palette)
         elif display == "none":
             pass
         else:
@@ -303,6 +311,16 @@ class Progress(commands.Cog):
             format_number(virgin_abuse_percentage),
         )
         progress_text += f"• Progress:\n**|`{bar}`|** `{correct_percentage}%`\n"
+        if is_tracked and not isinstance(template, Combo):
+            nb_griefed = tracked_templates.grief_detector.count_griefed(template, 3600)
+            progress_text += (
+                f"• Griefed in the last hour: `{format_number(nb_griefed)}` px\n"
+            )
+        last_change = template.get_last_change()
+        if last_change:
+            nb_changed = int(np.count_nonzero(template.get_recent_changes_mask(60)))
+            progress_text += f"• Last change: {format_datetime(last_change, 'R')}"
+            progress_text += f" *(`{format_number(nb_changed)}` px in the last hour)*\n"
         if is_tracked:
             eta, eta_speed = await template.get_eta()
             if eta == "done" and nb_virgin_abuse == 0:
@@ -376,7 +394,7 @@ class Progress(commands.Cog):
             progress_file = await image_to_file(progress_image, f"{display}.png", embed)
             files.append(progress_file)
         template_file = await image_to_file(
-            Image.fromarray(template.get_array()), "template_image.png"
+            stats.palettize_image(template.palettized_array), "template_image.png"
         )
         files.append(template_file)
 
@@ -509,7 +527,7 @@ class Progress(commands.Cog):
     @staticmethod
     async def add(ctx, name, url):
         try:
-            template = await get_template_from_url(url)
+            template = await tracked_templates.loader.load(url)
         except ValueError as e:
             await ctx.send(f":x: {e}")
             return False
@@ -547,7 +565,7 @@ class Progress(commands.Cog):
         embed.description += f"**Progress**: {correct_percentage}% done ({correct_pixels}/{total_placeable})\n"
 
         detemp_file = await image_to_file(
-            Image.fromarray(template.get_array()), "detemplatize.png", embed
+            stats.palettize_image(template.palettized_array), "detemplatize.png", embed
         )
         await ctx.send(file=detemp_file, embed=embed)
         return True
@@ -1140,6 +1158,71 @@ class Progress(commands.Cog):
 
         return await confirm_view.message.edit(embed=embed)
 
+    @_progress.sub_command(name="alerts")
+    @commands.has_permissions(manage_channels=True)
+    async def _alerts(
+        self,
+        inter: disnake.AppCmdInter,
+        template: str = commands.Param(autocomplete=autocomplete_templates),
+        channel: disnake.TextChannel = None,
+    ):
+        """Send an alert in a channel when a template is being griefed.
+
+        Parameters
+        ----------
+        template: The name of the template to follow.
+        channel: The channel where the alerts are sent (leave empty to disable the alerts)."""
+        await inter.response.defer()
+        await self.alerts(inter, template, channel)
+
+    @progress.command(
+        name="alerts",
+        description="Send an alert in a channel when a template is being griefed.",
+        usage="<template> <#channel|here|none>",
+        help="""- `<#channel>`: send the alerts in the given channel
+                - `<here>`: send the alerts in the current channel
+                - `<none>`: disable the alerts""",
+    )
+    @commands.has_permissions(manage_channels=True)
+    async def p_alerts(self, ctx, template: str, channel: str):
+        if len(ctx.message.channel_mentions) != 0:
+            channel = ctx.message.channel_mentions[0]
+        elif channel == "here":
+            channel = ctx.channel
+        elif channel == "none":
+            channel = None
+        else:
+            return await ctx.send("❌ You need to give a valid channel.")
+        async with ctx.typing():
+            await self.alerts(ctx, template, channel)
+
+    async def alerts(self, ctx, template_name, channel):
+        if ctx.guild is None:
+            return await ctx.send(":x: The alerts can only be set in a server.")
+        template = tracked_templates.get_template(template_name, None, False)
+        if template is None or isinstance(template, Combo):
+            return await ctx.send(f":x: No template named `{template_name}` found.")
+
+        if channel is None:
+            await db_templates.update_template_alert(template, ctx.guild.id, None)
+            return await ctx.send(
+                f"✅ The grief alerts of `{template.name}` won't be sent anymore."
+            )
+        if not channel.permissions_for(ctx.guild.me).send_messages:
+            return await ctx.send(
+                f":x: I don't have permissions to send messages in {channel.mention}."
+            )
+        await db_templates.update_template_alert(template, ctx.guild.id, channel.id)
+        detector = tracked_templates.grief_detector
+        await ctx.send(
+            "✅ An alert will be sent in {} when `{}` pixels of `{}` are griefed in less than {} minutes.".format(
+                channel.mention,
+                detector.threshold,
+                template.name,
+                round(detector.window / 60),
+            )
+        )
+
     @_progress.sub_command(name="speed")
     async def _speed(
         self,
@@ -1542,80 +1625,144 @@ class Progress(commands.Cog):
             canvas_start_date = canvas_start_date.replace(tzinfo=timezone.utc)
             lower_dt = max(canvas_start_date, lower_dt)
 
-        # get the snapshots URLs
         canvas_code = await stats.get_canvas_code()
-        snapshot_urls = await db_stats.get_snapshots_between(
-            lower_dt.astimezone(timezone.utc),
-            higher_dt.astimezone(timezone.utc),
-            canvas_code,
+        offset = 5  # offset around the template area (for the canvas display)
+        # use the snapshots saved locally if they cover the whole time frame
+        naive_lower_dt = lower_dt.astimezone(timezone.utc).replace(tzinfo=None)
+        naive_higher_dt = higher_dt.astimezone(timezone.utc).replace(tzinfo=None)
+        first_dt, last_dt = await db_snapshots.get_time_range(
+            naive_lower_dt, naive_higher_dt, canvas_code
         )
-        if len(snapshot_urls) < 2:
-            return await ctx.send(":x: The Time Frame Given is too short.")
-        snapshot_urls = shorten_list(snapshot_urls, min(nb_frames, len(snapshot_urls)))
-        nb_frames = len(snapshot_urls)
-
-        # enable the cooldown
-        self.timelapse_cd.update_rate_limit(ctx)
-
-        # download the snapshots
-        embed = disnake.Embed(color=0x66C5CC, title="Timelapse")
-        embed.description = "<a:typing:675416675591651329> **Downloading snapshots**...\n"
-        m = await ctx.send(embed=embed)
-        if m is None:
-            m = await ctx.original_message()
+        if (
+            first_dt is not None
+            and first_dt != last_dt
+            and first_dt - naive_lower_dt <= SNAPSHOT_INTERVAL
+            and naive_higher_dt - last_dt <= SNAPSHOT_INTERVAL
+        ):
+            download_step = "Loading the snapshots"
+
+            # enable the cooldown
+            self.timelapse_cd.update_rate_limit(ctx)
+
+            # load the snapshots
+            embed = disnake.Embed(color=0x66C5CC, title="Timelapse")
+            embed.description = f"<a:typing:675416675591651329> **{download_step}**...\n"
+            m = await ctx.send(embed=embed)
+            if m is None:
+                m = await ctx.original_message()
+            start = time.time()
+
+            local_frames = await db_snapshots.get_frames_between(
+                naive_lower_dt,
+                naive_higher_dt,
+                canvas_code,
+                nb_frames,
+                box=(
+                    template.ox - offset,
+                    template.oy - offset,
+                    template.ox + template.width + offset,
+                    template.oy + template.height + offset,
+                ),
+            )
+            if len(local_frames) < 2:
+                embed.description = f"**:x: {download_step}**... error\n"
+                embed.description += "Couldn't rebuild the snapshots saved locally."
+                embed.color = disnake.Color.red()
+                await m.edit(embed=embed)
+                return
+            snapshot_times = [frame[0] for frame in local_frames]
+            snapshots = [frame[1] for frame in local_frames]
+            nb_frames = len(snapshots)
+        else:
+            # get the snapshots URLs
+            snapshot_urls = await db_stats.get_snapshots_between(
+                lower_dt.astimezone(timezone.utc),
+                higher_dt.astimezone(timezone.utc),
+                canvas_code,
+            )
+            if len(snapshot_urls) < 2:
+                return await ctx.send(":x: The Time Frame Given is too short.")
+            snapshot_urls = shorten_list(
+                snapshot_urls, min(nb_frames, len(snapshot_urls))
+            )
+            snapshot_times = [url[0] for url in snapshot_urls]
+            nb_frames = len(snapshot_urls)
+            download_step = "Downloading the snapshots"
 
-        MAX_TASKS = 5  # number of simultaneous downloads
-        MAX_TIME = 120  # timeout before error
-        start = time.time()
+            # enable the cooldown
+            self.timelapse_cd.update_rate_limit(ctx)
 
-        async def download_frame(url, sess, sem):
-            async with sem:
-                async with sess.get(url) as res:
-                    content = await res.read()
-                if res.status != 200:
-                    return None
-                else:
-                    return Image.open(BytesIO(content))
+            # download the snapshots
+            embed = disnake.Embed(color=0x66C5CC, title="Timelapse")
+            embed.description = (
+                "<a:typing:675416675591651329> **Downloading snapshots**...\n"
+            )
+            m = await ctx.send(embed=embed)
+            if m is None:
+                m = await ctx.original_message()
 
-        tasks = []
-        sem = asyncio.Semaphore(MAX_TASKS)
-        try:
-            async with aiohttp.client.ClientSession() as sess:
-                for url in snapshot_urls:
-                    tasks.append(
-                        asyncio.wait_for(
-                            download_frame(url[2], sess, sem),
-                            timeout=MAX_TIME,
+            MAX_TASKS = 5  # number of simultaneous downloads
+            MAX_TIME = 120  # timeout before error
+            start = time.time()
+
+            async def download_frame(url, sess, sem):
+                async with sem:
+                    async with sess.get(url) as res:
+                        content = await res.read()
+                    if res.status != 200:
+                        return None
+                    else:
+                        return Image.open(BytesIO(content))
+
+            tasks = []
+            sem = asyncio.Semaphore(MAX_TASKS)
+            try:
+                async with aiohttp.client.ClientSession() as sess:
+                    for url in snapshot_urls:
+                        tasks.append(
+                            asyncio.wait_for(
+                                download_frame(url[2], sess, sem),
+                                timeout=MAX_TIME,
+                            )
                         )
-                    )
-                snapshot_images = await asyncio.gather(*tasks)
-        except Exception:
-            embed.description = "**:x: Downloading snapshots**... error\n"
-            embed.description += "An error occurred while downloading the snapshots."
-            embed.color = disnake.Color.red()
-            await m.edit(embed=embed)
-            return
+                    snapshots = await asyncio.gather(*tasks)
+            except Exception:
+                embed.description = "**:x: Downloading snapshots**... error\n"
+                embed.description += "An error occurred while downloading the snapshots."
+                embed.color = disnake.Color.red()
+                await m.edit(embed=embed)
+                return
 
         # crop the template area
-        embed.description = "✅ **Downloading the snapshots**... done!\n\n<a:typing:675416675591651329> **Cropping the snapshots**..."
+        embed.description = f"✅ **{download_step}**... done!\n\n<a:typing:675416675591651329> **Cropping the snapshots**..."
         await m.edit(embed=embed)
         frames = []
-        for snapshot_image in snapshot_images:
+        # the snapshots saved locally are already cropped around the template area:
+        # use a copy of the template moved to the crop coordinates to get the progress
+        cropped_template = copy(template)
+        cropped_template.ox = cropped_template.oy = offset
+        for snapshot in snapshots:
             if display == "canvas":
-                offset = 5  # offset around the template area
-                ss_frame = snapshot_image.crop(
-                    (
-                        template.ox - offset,
-                        template.oy - offset,
-                        template.ox + template.width + offset,
-                        template.oy + template.height + offset,
+                if isinstance(snapshot, np.ndarray):
+                    ss_frame = Image.fromarray(stats.palettize_array(snapshot))
+                else:
+                    ss_frame = snapshot.crop(
+                        (
+                            template.ox - offset,
+                            template.oy - offset,
+                            template.ox + template.width + offset,
+                            template.oy + template.height + offset,
+                        )
                     )
-                )
-                snapshot_image.close()
+                    snapshot.close()
             elif display == "progress":
-                snapshot_array = reduce(snapshot_image, get_rgba_palette())
-                template.update_progress(snapshot_array)
-                ss_frame = template.get_progress_image(board_array=snapshot_array)
+                if isinstance(snapshot, np.ndarray):
+                    cropped_template.update_progress(snapshot)
+                    ss_frame = cropped_template.get_progress_image(board_array=snapshot)
+                else:
+                    snapshot_array = reduce(snapshot, get_rgba_palette())
+                    template.update_progress(snapshot_array)
+                    ss_frame = template.get_progress_image(board_array=snapshot_array)
 
             # upscale the images if they're too big
             scale = find_upscale(ss_frame)
@@ -1628,7 +1775,9 @@ class Progress(commands.Cog):
                 ss_frame_resized = ss_frame
             frames.append(ss_frame_resized)
 
-        embed.description = "✅ **Downloading the snapshots**... done!\n\n✅ **Cropping the snapshots**... done!"
+        embed.description = (
+            f"✅ **{download_step}**... done!\n\n✅ **Cropping the snapshots**... done!"
+        )
         embed.description += (
             "\n\n<a:typing:675416675591651329> **Saving and sending the GIF**..."
         )
@@ -1646,8 +1795,8 @@ class Progress(commands.Cog):
         animated_img.seek(0)
 
         # prepare the embed with the informations
-        t0 = snapshot_urls[0][0]
-        t1 = snapshot_urls[-1][0]
+        t0 = snapshot_times[0]
+        t1 = snapshot_times[-1]
         diff_time = t1 - t0
         time_per_frame = diff_time / nb_frames
         description = "• Between {} and {}\n• Total time: `{}`\n• 1 frame = `{}`\n• Number of frames: `{}`\n• Frame duration: `{}ms` `({}fps)`".format(
@@ -1669,7 +1818,9 @@ class Progress(commands.Cog):
             await m.edit(embed=embed, file=file)
         except Exception:
             embed.set_footer(text="")
-            embed.description = "✅ **Downloading the snapshots**... done!\n\n✅ **Cropping the snapshots**... done!"
+            embed.description = (
+                f"✅ **{download_step}**... done!\n\n✅ **Cropping the snapshots**... done!"
+            )
             embed.description += "\n\n:x: **Saving and sending the GIF**... error\n(most likely the GIF is too big for discord's limit of 8MB)"
             embed.description += (
                 "\n\n<a:typing:675416675591651329> **Uploading to imgur**..."
@@ -1690,7 +1841,7 @@ class Progress(commands.Cog):
                     msg += f"(add `{cmd}` to the command)."
                 else:
                     msg = "unexpected error"
-                embed.description = "✅ **Downloading the snapshots**... done!\n\n✅ **Cropping the snapshots**... done!"
+                embed.description = f"✅ **{download_step}**... done!\n\n✅ **Cropping the snapshots**... done!"
                 embed.description += "\n\n:x: **Saving and sending the GIF**... error\n(most likely the GIF is too big for discord's limit of 8MB)"
                 embed.description += f"\n\n:x: **Uploading to imgur**... {msg}"
                 embed.color = disnake.Color.red()
@@ -3,7 +3,6 @@ from __future__ import annotations
 import disnake
 import numpy as np
 from disnake.ext import commands
-from PIL import Image
 
 from main import tracked_templates
 from utils.arguments_parser import MyParser
@@ -197,12 +196,12 @@ class TemplateCrop(commands.Cog):
             wrong_pixels_mask = np.logical_and(
                 ~template.placed_mask, template.placeable_mask
             )
-            cropped_board = template.crop_array_to_template(stats.board_array)
+            cropped_board = template.crop_buffer_to_template(stats.board_buffer)
             res_array[wrong_pixels_mask == 1] = cropped_board[wrong_pixels_mask == 1]
 
         if np.all(res_array == 255):
             return await ctx.send("❌ No placeable pixels in the cropped template.")
-        img = Image.fromarray(stats.palettize_array(res_array))
+        img = stats.palettize_image(res_array)
 
         embed = disnake.Embed(color=0x66C5CC, title="Cropped")
         file = await image_to_file(img, "cropped.png", embed)
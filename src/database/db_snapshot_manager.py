@@ -0,0 +1,191 @@
+import asyncio
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database.db_connection import DbConnection
+from utils.utils import in_executor, shorten_list
+
+# number of snapshots saved as diffs after each keyframe
+# (one keyframe per day with a snapshot every 15 minutes)
+KEYFRAME_INTERVAL = 96
+# time between 2 snapshots
+SNAPSHOT_INTERVAL = timedelta(minutes=15)
+
+
+def encode_keyframe(board_array: np.ndarray) -> bytes:
+    """Compress a board array of palette indexes."""
+    return zlib.compress(np.ascontiguousarray(board_array).tobytes())
+
+
+def encode_diff(previous_array: np.ndarray, board_array: np.ndarray) -> bytes:
+    """Compress the pixels that changed between 2 board arrays
+    (as uint32 flat indexes followed by their uint8 new values)."""
+    changed_indexes = np.flatnonzero(previous_array != board_array).astype("<u4")
+    new_values = board_array.reshape(-1)[changed_indexes]
+    return zlib.compress(changed_indexes.tobytes() + new_values.tobytes())
+
+
+def apply_diff(board_array: np.ndarray, data: bytes) -> None:
+    """Apply an encoded diff on a board array in place."""
+    raw = zlib.decompress(data)
+    nb_changes = len(raw) // 5
+    changed_indexes = np.frombuffer(raw, dtype="<u4", count=nb_changes)
+    new_values = np.frombuffer(raw, dtype=np.uint8, offset=4 * nb_changes)
+    board_array.reshape(-1)[changed_indexes] = new_values
+
+
+def crop_box(board_array: np.ndarray, box) -> np.ndarray:
+    """Copy the area (x0, y0, x1, y1) of a board array,
+    the parts of the area outside the board are filled with 255."""
+    x0, y0, x1, y1 = box
+    height, width = board_array.shape
+    cy0, cy1 = min(max(0, y0), height), max(0, min(height, y1))
+    cx0, cx1 = min(max(0, x0), width), max(0, min(width, x1))
+    cropped_array = np.full((y1 - y0, x1 - x0), 255, dtype=np.uint8)
+    cropped_array[cy0 - y0 : cy1 - y0, cx0 - x0 : cx1 - x0] = board_array[
+        cy0:cy1, cx0:cx1
+    ]
+    return cropped_array
+
+
+@in_executor()
+def decode_frames(rows, selected_indexes, box=None) -> list:
+    """Rebuild the board arrays of the selected rows.
+
+    The rows must start with a keyframe and be sorted by datetime,
+    `selected_indexes` are the indexes of the rows to return.
+    If a `box` (x0, y0, x1, y1) is given, only this area of the boards is returned."""
+    selected_indexes = set(selected_indexes)
+    frames = []
+    board_array = None
+    for i, row in enumerate(rows):
+        if row["is_keyframe"]:
+            board_array = np.frombuffer(
+                zlib.decompress(row["data"]), dtype=np.uint8
+            ).reshape(row["height"], row["width"])
+            board_array = board_array.copy()
+        else:
+            apply_diff(board_array, row["data"])
+        if i in selected_indexes:
+            if box is None:
+                frames.append((row["datetime"], board_array.copy()))
+            else:
+                frames.append((row["datetime"], crop_box(board_array, box)))
+    return frames
+
+
+class DbSnapshotManager:
+    """A class to save the board snapshots locally in the database.
+
+    A snapshot is saved either as a keyframe (the whole board array compressed)
+    or as a compressed diff with the previous snapshot."""
+
+    def __init__(self, db_conn: DbConnection) -> None:
+        self.db = db_conn
+        # the last snapshot saved: (canvas code, board array, number of diffs since the last keyframe)
+        self.last_snapshot = None
+
+    async def create_tables(self):
+        create_board_snapshot_table = """
+            CREATE TABLE IF NOT EXISTS board_snapshot(
+                datetime TIMESTAMP,
+                canvas_code TEXT,
+                is_keyframe BOOLEAN,
+                width INTEGER,
+                height INTEGER,
+                data BLOB,
+                PRIMARY KEY (datetime, canvas_code)
+            );"""
+        await self.db.sql_update(create_board_snapshot_table)
+
+    async def save_board_snapshot(
+        self, dt: datetime, canvas_code: str, board_array: np.ndarray
+    ):
+        """Save a board array at the given datetime"""
+        is_keyframe = (
+            self.last_snapshot is None
+            or self.last_snapshot[0] != canvas_code
+            or self.last_snapshot[1].shape != board_array.shape
+            or self.last_snapshot[2] >= KEYFRAME_INTERVAL
+        )
+        loop = asyncio.get_running_loop()
+        if is_keyframe:
+            data = await loop.run_in_executor(None, encode_keyframe, board_array)
+        else:
+            data = await loop.run_in_executor(
+                None, encode_diff, self.last_snapshot[1], board_array
+            )
+
+        sql = """
+            INSERT INTO board_snapshot (datetime, canvas_code, is_keyframe, width, height, data)
+            VALUES (?, ?, ?, ?, ?, ?)"""
+        height, width = board_array.shape
+        await self.db.sql_insert(sql, (dt, canvas_code, is_keyframe, width, height, data))
+        nb_diffs = 0 if is_keyframe else self.last_snapshot[2] + 1
+        self.last_snapshot = (canvas_code, board_array, nb_diffs)
+
+    async def get_time_range(self, dt1, dt2, canvas_code):
+        """Get the datetimes of the first and last snapshots saved between
+        2 datetimes (None, None if there are none)."""
+        sql = """
+            SELECT datetime
+            FROM board_snapshot
+            WHERE datetime BETWEEN ? AND ?
+            AND canvas_code = ?
+            ORDER BY datetime {}
+            LIMIT 1
+        """
+        first = await self.db.sql_select(sql.format("ASC"), (dt1, dt2, canvas_code))
+        last = await self.db.sql_select(sql.format("DESC"), (dt1, dt2, canvas_code))
+        if not first or not last:
+            return None, None
+        return first[0]["datetime"], last[0]["datetime"]
+
+    async def get_frames_between(self, dt1, dt2, canvas_code, nb_frames, box=None):
+        """Get up to `nb_frames` evenly spaced board arrays saved between 2 datetimes,
+        cropped to the area `box` (x0, y0, x1, y1) if one is given.
+
+        Return a list of (datetime, board array) sorted by datetime."""
+        sql = """
+            SELECT datetime
+            FROM board_snapshot
+            WHERE datetime BETWEEN ? AND ?
+            AND canvas_code = ?
+            ORDER BY datetime
+        """
+        rows = await self.db.sql_select(sql, (dt1, dt2, canvas_code))
+        if not rows:
+            return []
+        selected = shorten_list(list(range(len(rows))), min(nb_frames, len(rows)))
+        first_dt = rows[selected[0]]["datetime"]
+        last_dt = rows[selected[-1]]["datetime"]
+
+        # find the keyframe needed to rebuild the first frame
+        sql = """
+            SELECT datetime
+            FROM board_snapshot
+            WHERE datetime <= ?
+            AND canvas_code = ?
+            AND is_keyframe
+            ORDER BY datetime DESC
+            LIMIT 1
+        """
+        keyframe = await self.db.sql_select(sql, (first_dt, canvas_code))
+        if not keyframe:
+            return []
+        keyframe_dt = keyframe[0]["datetime"]
+
+        sql = """
+            SELECT datetime, is_keyframe, width, height, data
+            FROM board_snapshot
+            WHERE datetime BETWEEN ? AND ?
+            AND canvas_code = ?
+            ORDER BY datetime
+        """
+        data_rows = await self.db.sql_select(sql, (keyframe_dt, last_dt, canvas_code))
+        # convert the selected indexes to indexes in the data rows
+        offset = [r["datetime"] for r in data_rows].index(first_dt)
+        selected_indexes = [i - selected[0] + offset for i in selected]
+        return await decode_frames(data_rows, selected_indexes, box)
@@ -42,8 +42,19 @@ class DbTemplateManager:
                 FOREIGN KEY(template_id) REFERENCES template(id)
             );
         """
+
+        create_template_alert_table = """
+            CREATE TABLE IF NOT EXISTS template_alert(
+                template_id INTEGER,
+                server_id TEXT,
+                channel_id TEXT,
+                PRIMARY KEY(template_id, server_id),
+                FOREIGN KEY(template_id) REFERENCES template(id)
+            );
+        """
         await self.db.sql_update(create_template_table)
         await self.db.sql_update(create_template_stat_table)
+        await self.db.sql_update(create_template_alert_table)
 
     async def get_template_id(self, t: "Template"):
         """Return the template ID matching with the args from the database, Return None if it doesn't exist"""
@@ -97,6 +108,9 @@ class DbTemplateManager:
         sql = "DELETE from template_stat WHERE template_id = ?"
         await self.db.sql_update(sql, template_id)
 
+        sql = "DELETE from template_alert WHERE template_id = ?"
+        await self.db.sql_update(sql, template_id)
+
         sql = "DELETE from template WHERE id = ?"
         await self.db.sql_update(sql, template_id)
 
@@ -182,6 +196,28 @@ class DbTemplateManager:
             logger.info("New combo created in the database")
         return await self.create_template_stat(combo, datetime, progress)
 
+    async def update_template_alert(self, t: "Template", server_id, channel_id):
+        """Set the channel where the grief alerts of a template are sent in a server
+        (disable them if channel_id is None)"""
+        if channel_id is None:
+            sql = "DELETE FROM template_alert WHERE template_id = ? AND server_id = ?"
+            return await self.db.sql_update(sql, (t.id, server_id))
+        sql = """
+            INSERT OR REPLACE INTO template_alert(template_id, server_id, channel_id)
+            VALUES (?, ?, ?)"""
+        return await self.db.sql_update(sql, (t.id, server_id, channel_id))
+
+    async def delete_template_alert_channel(self, t: "Template", channel_id):
+        """Stop sending the grief alerts of a template in a channel"""
+        sql = "DELETE FROM template_alert WHERE template_id = ? AND channel_id = ?"
+        return await self.db.sql_update(sql, (t.id, channel_id))
+
+    async def get_template_alert_channels(self, t: "Template"):
+        """Get the IDs of the channels where the grief alerts of a template are sent"""
+        sql = "SELECT channel_id FROM template_alert WHERE template_id = ?"
+        rows = await self.db.sql_select(sql, (t.id,))
+        return [row[0] for row in rows]
+
     async def check_duplicate_name(self, t: "Template"):
         sql = "SELECT * FROM template where LOWER(name) = LOWER(?) AND canvas_code = ? AND hidden = ?"
         res = await self.db.sql_select(sql, (t.name, t.canvas_code, t.hidden))
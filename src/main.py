@@ -13,10 +13,12 @@ from utils.setup import (
     GUILD_IDS,
     db_canvas,
     db_servers,
+    db_snapshots,
     db_stats,
     db_templates,
     db_users,
 )
+from utils.utils import http_client
 
 load_dotenv()
 intents = disnake.Intents.all()
@@ -29,7 +31,16 @@ allowed_mentions = disnake.AllowedMentions(
     roles=False,
     replied_user=False,
 )
-bot = commands.Bot(
+
+
+class Bot(commands.Bot):
+    async def close(self):
+        await super().close()
+        # close the pooled HTTP connections
+        await http_client.close()
+
+
+bot = Bot(
     command_prefix=db_servers.get_prefix,
     help_command=None,
     intents=intents,
@@ -51,6 +62,7 @@ async def on_connect():
     await db_stats.create_tables()
     await db_templates.create_tables()
     await db_canvas.create_tables()
+    await db_snapshots.create_tables()
     await db_canvas.setup()
 
 
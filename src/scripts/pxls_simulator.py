@@ -0,0 +1,219 @@
+"""A local stand-in for the pxls.space API and websocket.
+
+It serves a random canvas on the endpoints used by the bot and streams random
+pixels on the websocket at a configurable rate, to run and profile the bot offline.
+
+Start it with:
+    $ python src/scripts/pxls_simulator.py --rate 500
+and point the bot to it with the environment variables:
+    PXLS_URL=http://localhost:8080/
+    PXLS_WS_URI=ws://localhost:8080/ws
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from aiohttp import web
+
+DEFAULT_PALETTE = (
+    "FFFFFF C2CBD4 858D98 4B4F58 22272D 000000 38271D 6C422C BC7541 FFB27F FFD68F "
+    "FEAD6C F27C2E E5533B CF2A2E FF8CB5 FF4F90 C31F6A 9A1E8C 6E2194 D4C4FF A17BE0 "
+    "5340A1 2D2F8C 253DA6 1F7DFF 7AC3FF B3F5FF 00B79C 1FDB62 BDEE6B 7B9E31"
+).split()
+# time (in seconds) for a pixel of the heatmap to go from 255 to 0
+HEATMAP_COOLDOWN = 3 * 60 * 60
+# number of websocket messages sent per second
+TICKS_PER_SECOND = 10
+
+
+class PxlsSimulator:
+    """A simulated canvas updated by random pixels placed at `rate` pixels/second."""
+
+    def __init__(self, width, height, rate, nb_users, canvas_code="sim", seed=None):
+        self.width = width
+        self.height = height
+        self.rate = rate
+        self.nb_users = nb_users
+        self.canvas_code = canvas_code
+        self.rng = np.random.default_rng(seed)
+        self.palette = [
+            dict(name=f"Color {i}", value=hex) for i, hex in enumerate(DEFAULT_PALETTE)
+        ]
+
+        shape = (height, width)
+        # unplaceable border around the canvas
+        self.placemap = np.full(shape, 255, dtype=np.uint8)
+        self.placemap[height // 20 : -height // 20, width // 20 : -width // 20] = 0
+        self.board = self.rng.integers(0, len(self.palette), shape, dtype=np.uint8)
+        self.board[self.placemap != 0] = 255
+        self.initial_board = self.board.copy()
+        self.virginmap = np.full(shape, 255, dtype=np.uint8)
+        # time of the last pixel placed on each coordinate (for the heatmap)
+        self.last_placed = np.full(shape, -np.inf)
+        self.placeable_indexes = np.flatnonzero(self.placemap == 0)
+
+        self.usernames = [f"user{i}" for i in range(nb_users)]
+        self.user_pixels = np.zeros(nb_users, dtype=np.int64)
+        self.total_placed = 0
+        self.websockets = set()
+
+    def place_random_pixels(self, amount):
+        """Place `amount` random pixels on the canvas and return them."""
+        indexes = self.rng.choice(self.placeable_indexes, amount)
+        colors = self.rng.integers(0, len(self.palette), amount, dtype=np.uint8)
+        self.board.reshape(-1)[indexes] = colors
+        self.virginmap.reshape(-1)[indexes] = 0
+        self.last_placed.reshape(-1)[indexes] = time.time()
+        users = self.rng.integers(0, self.nb_users, amount)
+        np.add.at(self.user_pixels, users, 1)
+        self.total_placed += amount
+        ys, xs = np.divmod(indexes, self.width)
+        return [dict(x=int(x), y=int(y), color=int(c)) for x, y, c in zip(xs, ys, colors)]
+
+    def get_heatmap(self):
+        age = time.time() - self.last_placed
+        heat = 255 * (1 - age / HEATMAP_COOLDOWN)
+        return np.ceil(np.clip(heat, 0, 255)).astype(np.uint8)
+
+    def get_online_count(self):
+        return max(1, int(self.nb_users * 0.1 + self.rng.integers(-10, 10)))
+
+    def get_users(self):
+        return {"count": self.get_online_count()}
+
+    def get_info(self):
+        return {
+            "canvasCode": self.canvas_code,
+            "width": self.width,
+            "height": self.height,
+            "palette": self.palette,
+            "heatmapCooldown": HEATMAP_COOLDOWN,
+            "cooldownInfo": {
+                "type": "activity",
+                "staticCooldownSeconds": 0,
+                "activityCooldown": {
+                    "steepness": 2.5,
+                    "multiplier": 1.0,
+                    "globalOffset": 6.5,
+                    "userOffset": 11.96,
+                },
+            },
+        }
+
+    def get_stats(self):
+        order = np.argsort(-self.user_pixels, kind="stable")
+        toplist = [
+            dict(username=self.usernames[i], pixels=int(self.user_pixels[i]), place=rank)
+            for rank, i in enumerate(order, start=1)
+            if self.user_pixels[i] > 0
+        ]
+        generated_at = datetime.now(timezone.utc).strftime("%Y/%m/%d - %H:%M:%S")
+        return {
+            "general": {
+                "total_users": self.nb_users,
+                "total_factions": 0,
+                "total_pixels_placed": self.total_placed,
+                "users_active_this_canvas": max(1, len(toplist)),
+                "nth_list": [],
+            },
+            "toplist": {"alltime": toplist, "canvas": toplist},
+            "board_info": {"canvasCode": self.canvas_code, "palette": self.palette},
+            "generatedAt": f"{generated_at} (UTC)",
+        }
+
+    async def broadcast(self, message):
+        data = json.dumps(message)
+        for ws in list(self.websockets):
+            try:
+                await ws.send_str(data)
+            except Exception:
+                self.websockets.discard(ws)
+
+    async def stream_pixels(self):
+        """Send the random pixels and the online count on the websocket forever."""
+        interval = 1 / TICKS_PER_SECOND
+        remainder = 0.0
+        last_users_message = 0
+        while True:
+            start = time.monotonic()
+            # spread the rate over the ticks
+            remainder += self.rate / TICKS_PER_SECOND
+            amount = int(remainder)
+            remainder -= amount
+            if amount:
+                pixels = self.place_random_pixels(amount)
+                await self.broadcast({"type": "pixel", "pixels": pixels})
+            if start - last_users_message > 5:
+                last_users_message = start
+                await self.broadcast({"type": "users", "count": self.get_online_count()})
+            await asyncio.sleep(max(0, interval - (time.monotonic() - start)))
+
+    def make_app(self):
+        def json_handler(get_payload):
+            async def handler(request):
+                return web.json_response(get_payload())
+
+            return handler
+
+        def bytes_handler(get_array):
+            async def handler(request):
+                return web.Response(body=get_array().tobytes())
+
+            return handler
+
+        async def websocket_handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            self.websockets.add(ws)
+            try:
+                async for _ in ws:
+                    pass
+            finally:
+                self.websockets.discard(ws)
+            return ws
+
+        async def start_stream(app):
+            app["stream"] = asyncio.create_task(self.stream_pixels())
+
+        async def stop_stream(app):
+            app["stream"].cancel()
+
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/info", json_handler(self.get_info)),
+                web.get("/users", json_handler(self.get_users)),
+                web.get("/stats/stats.json", json_handler(self.get_stats)),
+                web.get("/boarddata", bytes_handler(lambda: self.board)),
+                web.get("/initialboarddata", bytes_handler(lambda: self.initial_board)),
+                web.get("/virginmap", bytes_handler(lambda: self.virginmap)),
+                web.get("/placemap", bytes_handler(lambda: self.placemap)),
+                web.get("/heatmap", bytes_handler(self.get_heatmap)),
+                web.get("/ws", websocket_handler),
+            ]
+        )
+        app.on_startup.append(start_stream)
+        app.on_cleanup.append(stop_stream)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument(
+        "--rate", type=float, default=50, help="number of pixels placed per second"
+    )
+    parser.add_argument("--users", type=int, default=5000, help="number of users")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = PxlsSimulator(
+        args.width, args.height, args.rate, args.users, seed=args.seed
+    )
+    web.run_app(simulator.make_app(), host=args.host, port=args.port)
@@ -0,0 +1,55 @@
+"""Replay a websocket capture on an offline canvas to benchmark the pixels ingest.
+
+The captures are saved by the bot when the PXLS_WS_CAPTURE environment variable is
+set to a file path. Replay one with:
+    $ python src/scripts/replay_websocket.py capture.bin --width 2000 --height 2000
+(use `--speed 0` to replay as fast as possible)
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.pxls.pxls_stats_manager import PxlsStatsManager  # noqa: E402
+from utils.pxls.websocket_capture import replay_capture  # noqa: E402
+from utils.pxls.websocket_client import WebsocketClient  # noqa: E402
+
+
+async def replay(capture_path, width, height, speed):
+    # blank canvas: fully placeable and virgin
+    stats = PxlsStatsManager(None)
+    stats.board_info = {"width": width, "height": height}
+    stats.board_buffer.load(bytes(width * height), height, width)
+    stats.placemap_buffer.load(bytes(width * height), height, width)
+    stats.virginmap_buffer.load(b"\xff" * (width * height), height, width)
+    client = WebsocketClient(None, stats)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    nb_frames = await replay_capture(capture_path, client, speed)
+    duration = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Replayed {nb_frames} frames ({client.pixel_count} pixels) in {duration:.2f}s")
+    print(f"Ingest speed: {client.pixel_count / max(duration, 1e-9):.0f} pixels/s")
+    print(f"Peak memory allocated during the replay: {peak_memory / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="path of the capture file")
+    parser.add_argument("--width", type=int, required=True)
+    parser.add_argument("--height", type=int, required=True)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="replay speed multiplier (0 = as fast as possible)",
+    )
+    args = parser.parse_args()
+    asyncio.run(replay(args.capture, args.width, args.height, args.speed))
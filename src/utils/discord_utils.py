@@ -301,6 +301,17 @@ def image_to_file(
         return image
 
 
+def png_to_file(
+    png_bytes: bytes, filename: str, embed: disnake.Embed = None
+) -> disnake.File:
+    """Convert PNG bytes to a discord File
+    attach the file to a discord embed if one is given"""
+    file = disnake.File(BytesIO(png_bytes), filename=filename)
+    if embed:
+        embed.set_image(url=f"attachment://{filename}")
+    return file
+
+
 async def number_emoji(ctx):
     emojis = await ctx.guild.fetch_emojis()
     nb_static = 0
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+
+def decode_board(board_bytes: bytes, height: int, width: int) -> np.ndarray:
+    """Decode a board payload (one palette index per byte) to a (height, width)
+    uint8 array without copying it.
+
+    The returned array is a read-only view on `board_bytes`.
+    Raise ValueError if the payload doesn't match the board size."""
+    expected_size = height * width
+    if len(board_bytes) != expected_size:
+        raise ValueError(
+            f"Invalid board data size: got {len(board_bytes)} bytes, expected {expected_size}."
+        )
+    return np.frombuffer(board_bytes, dtype=np.uint8).reshape(height, width)
+
+
+def last_occurrences(flat_indexes: np.ndarray) -> np.ndarray:
+    """Get the positions of the last occurrence of each distinct value in
+    `flat_indexes` (numpy doesn't guarantee which value wins when a scatter
+    assignment has duplicate indexes)."""
+    _, reversed_positions = np.unique(flat_indexes[::-1], return_index=True)
+    return flat_indexes.size - 1 - reversed_positions
+
+
+@dataclass
+class BoardChanges:
+    """The pixels that changed value when a batch was applied on a board."""
+
+    shape: tuple[int, int]
+    flat_indexes: np.ndarray
+    old_values: np.ndarray
+    new_values: np.ndarray
+    # the board version after the changes
+    version: int
+
+    @property
+    def xs(self) -> np.ndarray:
+        return self.flat_indexes % self.shape[1]
+
+    @property
+    def ys(self) -> np.ndarray:
+        return self.flat_indexes // self.shape[1]
+
+
+class BoardBuffer:
+    """A versioned uint8 board array with copy-on-write snapshots.
+
+    Writers (the websocket thread and the periodic board refresh) update a live
+    array in place and increase `version` on every change. Readers never see the
+    live array: they get a read-only snapshot of it, copied at most once per version,
+    so a snapshot stays consistent while pixels keep being written."""
+
+    def __init__(self) -> None:
+        self._live: np.ndarray = None
+        self._lock = threading.Lock()
+        self.version = 0
+        # version of the last full board load
+        self.load_version = 0
+        self._snapshot: np.ndarray = None
+        self._snapshot_version = None
+
+    def load(self, board_bytes: bytes, height: int, width: int) -> np.ndarray:
+        """Copy a board payload in the live array and return a snapshot of it.
+
+        The live array is only reallocated when the board dimensions change."""
+        board_view = decode_board(board_bytes, height, width)
+        with self._lock:
+            if self._live is None or self._live.shape != board_view.shape:
+                self._live = np.empty(board_view.shape, dtype=np.uint8)
+            np.copyto(self._live, board_view)
+            self.version += 1
+            self.load_version = self.version
+        return self.array
+
+    def set_pixels(self, xs: np.ndarray, ys: np.ndarray, values) -> BoardChanges:
+        """Set a batch of pixels in the live array with a single scatter.
+
+        `values` can be an array (one value per pixel) or a single value.
+        When a pixel appears several times in the batch, the last value wins.
+        Pixels outside the board and batches received before the first load
+        are ignored.
+
+        Return the pixels that changed value (None if the board wasn't loaded)."""
+        with self._lock:
+            if self._live is None:
+                return None
+            shape = self._live.shape
+            height, width = shape
+            xs = np.asarray(xs, dtype=np.intp)
+            ys = np.asarray(ys, dtype=np.intp)
+            values = np.broadcast_to(np.asarray(values, dtype=np.uint8), xs.shape)
+            in_bounds = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            flat_indexes = ys[in_bounds] * width + xs[in_bounds]
+            values = values[in_bounds]
+            last_indexes = last_occurrences(flat_indexes)
+            flat_indexes = flat_indexes[last_indexes]
+            values = values[last_indexes]
+
+            flat_live = self._live.reshape(-1)
+            old_values = flat_live[flat_indexes]
+            changed = old_values != values
+            if np.any(changed):
+                flat_live[flat_indexes[changed]] = values[changed]
+                self.version += 1
+            return BoardChanges(
+                shape,
+                flat_indexes[changed],
+                old_values[changed],
+                values[changed],
+                self.version,
+            )
+
+    def get_values(self, flat_indexes: np.ndarray) -> np.ndarray:
+        """Get the current values at indexes of the flattened board
+        (`None` if no board was loaded yet)."""
+        with self._lock:
+            if self._live is None:
+                return None
+            return self._live.reshape(-1)[flat_indexes]
+
+    def read_region(
+        self, x0: int, y0: int, x1: int, y1: int, step: int = 1
+    ) -> tuple[int, np.ndarray]:
+        """Get the current version and a copy of the region between (x0, y0) and
+        (x1, y1) (excluded), keeping one pixel every `step` pixels, without copying
+        the whole board (`None` if no board was loaded yet)."""
+        with self._lock:
+            if self._live is None:
+                return self.version, None
+            return self.version, self._live[y0:y1:step, x0:x1:step].copy()
+
+    def crop(
+        self, ox: int, oy: int, width: int, height: int, fill: int = 255
+    ) -> np.ndarray:
+        """Get a copy of the area of size (width, height) at (ox, oy), with the parts
+        of the area outside the board filled with `fill`, without copying the whole
+        board (`None` if no board was loaded yet)."""
+        with self._lock:
+            if self._live is None:
+                return None
+            board_height, board_width = self._live.shape
+            y0, y1 = min(max(0, oy), board_height), max(0, min(board_height, oy + height))
+            x0, x1 = min(max(0, ox), board_width), max(0, min(board_width, ox + width))
+            res = np.full((height, width), fill, dtype=np.uint8)
+            res[y0 - oy : y1 - oy, x0 - ox : x1 - ox] = self._live[y0:y1, x0:x1]
+        return res
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """The shape of the board (`None` if no board was loaded yet)."""
+        with self._lock:
+            return None if self._live is None else self._live.shape
+
+    def snapshot(self) -> tuple[int, np.ndarray]:
+        """Get the current version and a read-only snapshot of the board
+        (`None` if no board was loaded yet)."""
+        with self._lock:
+            if self._live is None:
+                return self.version, None
+            if self._snapshot_version != self.version:
+                snapshot = self._live.copy()
+                snapshot.flags.writeable = False
+                self._snapshot = snapshot
+                self._snapshot_version = self.version
+            return self.version, self._snapshot
+
+    @property
+    def array(self) -> np.ndarray:
+        """A read-only snapshot of the current board."""
+        return self.snapshot()[1]
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import random
+import time
+
+# number of consecutive failures before the circuit opens
+FAILURE_THRESHOLD = 3
+# delay (in seconds) before retrying after the circuit opens, doubled at each
+# new failure up to MAX_DELAY
+BASE_DELAY = 10
+MAX_DELAY = 5 * 60
+
+
+class CircuitOpenError(ValueError):
+    """Raised when a request is skipped because the endpoint is unhealthy."""
+
+
+class CircuitBreaker:
+    """Track the failures of an endpoint to stop sending it requests while it's down.
+
+    After `failure_threshold` consecutive failures the circuit opens: the requests
+    are skipped until a jittered exponential backoff delay has passed, then a single
+    request is let through to check if the endpoint is back."""
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.failure_threshold
+
+    def _backoff_delay(self) -> float:
+        nb_retries = self.failures - self.failure_threshold
+        delay = min(self.max_delay, self.base_delay * 2 ** min(nb_retries, 16))
+        # jitter so the retries of the different endpoints don't line up
+        return random.uniform(delay / 2, delay)
+
+    def allow_request(self) -> bool:
+        """Check if a request can be sent now."""
+        if not self.is_open:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        # let this request through and hold the others until it fails or succeeds
+        self._retry_at = now + self._backoff_delay()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._retry_at = 0.0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.is_open:
+            self._retry_at = time.monotonic() + self._backoff_delay()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+from utils.pxls.board_buffer import BoardBuffer, BoardChanges
+
+NB_INDEXES = 256
+
+
+class ColorCounts:
+    """The number of pixels of each color on the placeable part of the canvas,
+    live from the websocket.
+
+    The counts are computed with `np.bincount` when a board is (re)loaded and are
+    then adjusted with the old and new values of the pixels changed by each batch,
+    so reading them doesn't need to scan the canvas.
+
+    - amounts: number of placeable pixels of each color index
+    - placed_amounts: same but only counting the non-virgin pixels"""
+
+    def __init__(
+        self, board: BoardBuffer, placemap: BoardBuffer, virginmap: BoardBuffer
+    ) -> None:
+        self.board = board
+        self.placemap = placemap
+        self.virginmap = virginmap
+        self._lock = threading.Lock()
+        self._amounts: np.ndarray = None
+        self._placed_amounts: np.ndarray = None
+        self._placeable: np.ndarray = None
+        # load versions of the boards used for the last count and the versions
+        # already included in the counts
+        self._load_versions = None
+        self._board_version = None
+        self._virginmap_version = None
+
+    def _current_load_versions(self):
+        return (
+            self.board.load_version,
+            self.placemap.load_version,
+            self.virginmap.load_version,
+        )
+
+    def _count(self) -> None:
+        board_version, board = self.board.snapshot()
+        _, placemap = self.placemap.snapshot()
+        virginmap_version, virginmap = self.virginmap.snapshot()
+        if board is None or placemap is None or virginmap is None:
+            self._amounts = None
+            return
+        self._placeable = (placemap == 0).reshape(-1)
+        flat_board = board.reshape(-1)
+        placed = self._placeable & (virginmap.reshape(-1) == 0)
+        self._amounts = np.bincount(flat_board[self._placeable], minlength=NB_INDEXES)
+        self._placed_amounts = np.bincount(flat_board[placed], minlength=NB_INDEXES)
+        self._load_versions = self._current_load_versions()
+        self._board_version = board_version
+        self._virginmap_version = virginmap_version
+
+    def update(
+        self, board_changes: BoardChanges, virginmap_changes: BoardChanges
+    ) -> None:
+        """Adjust the counts with the changes of a batch of pixels,
+        called after the changes are applied on the board and virginmap."""
+        with self._lock:
+            if self._amounts is None or self._load_versions != (
+                self._current_load_versions()
+            ):
+                # the counts are computed again on the next read
+                return
+            empty = np.empty(0, dtype=np.intp)
+            board_indexes = old_values = new_values = empty
+            virgin_indexes = old_virgin = empty
+            if board_changes is not None and board_changes.version > self._board_version:
+                board_indexes = board_changes.flat_indexes
+                old_values = board_changes.old_values
+                new_values = board_changes.new_values
+            if (
+                virginmap_changes is not None
+                and virginmap_changes.version > self._virginmap_version
+            ):
+                virgin_indexes = virginmap_changes.flat_indexes
+                old_virgin = virginmap_changes.old_values
+            if board_indexes.size == 0 and virgin_indexes.size == 0:
+                return
+
+            # colors of the placeable pixels that changed
+            placeable = self._placeable[board_indexes]
+            self._amounts -= np.bincount(old_values[placeable], minlength=NB_INDEXES)
+            self._amounts += np.bincount(new_values[placeable], minlength=NB_INDEXES)
+
+            # colors of the non-virgin pixels before and after the changes
+            indexes = np.union1d(board_indexes, virgin_indexes)
+            values_after = self.board.get_values(indexes)
+            virgin_after = self.virginmap.get_values(indexes)
+            values_before = values_after.copy()
+            values_before[np.searchsorted(indexes, board_indexes)] = old_values
+            virgin_before = virgin_after.copy()
+            virgin_before[np.searchsorted(indexes, virgin_indexes)] = old_virgin
+            placeable = self._placeable[indexes]
+            placed_before = values_before[placeable & (virgin_before == 0)]
+            placed_after = values_after[placeable & (virgin_after == 0)]
+            self._placed_amounts -= np.bincount(placed_before, minlength=NB_INDEXES)
+            self._placed_amounts += np.bincount(placed_after, minlength=NB_INDEXES)
+
+    def get_counts(self) -> tuple[np.ndarray, np.ndarray]:
+        """Get copies of the (amounts, placed_amounts) arrays indexed by color index
+        (None if the boards weren't loaded yet)."""
+        with self._lock:
+            if self._amounts is None or self._load_versions != (
+                self._current_load_versions()
+            ):
+                self._count()
+            if self._amounts is None:
+                return None
+            return self._amounts.copy(), self._placed_amounts.copy()
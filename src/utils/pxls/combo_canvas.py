@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import numpy as np
+
+# owner of the pixels not covered by any template
+NO_OWNER = -1
+
+
+class ComboCanvas:
+    """The @combo image maintained incrementally from the tracked templates.
+
+    It is kept as 2 canvas-sized layers: the owner of each pixel (the id of the
+    template shown on it) and its palette index. The templates with a lower id are
+    on top. Adding or removing a template only rewrites its bounding box, the
+    pixels it uncovers are given back to the templates under it."""
+
+    def __init__(self) -> None:
+        self.owners: np.ndarray = None
+        self.colors: np.ndarray = None
+        # the templates layered on the canvas by id(template)
+        self._templates: dict[int, object] = {}
+
+    def __contains__(self, template) -> bool:
+        return id(template) in self._templates
+
+    def reset(self, shape: tuple[int, int]) -> None:
+        self.owners = np.full(shape, NO_OWNER, dtype=np.int64)
+        self.colors = np.full(shape, 255, dtype=np.uint8)
+        self._templates.clear()
+
+    def sync(self, templates: list, shape: tuple[int, int]) -> None:
+        """Update the layers to match a list of templates:
+        only the templates added or removed since the last sync are (un)layered.
+        The layers are made again from scratch if the canvas shape changed."""
+        if self.owners is None or self.owners.shape != shape:
+            self.reset(shape)
+        template_ids = {id(t) for t in templates}
+        for template in list(self._templates.values()):
+            if id(template) not in template_ids:
+                self.remove(template)
+        for template in templates:
+            if id(template) not in self._templates:
+                self.add(template)
+
+    def _get_region(self, template, box=None):
+        """Get the slices of the template bounding box (or of `box`, a part of it)
+        clipped to the canvas and the matching part of the template array.
+        Return None if it's outside the canvas."""
+        height, width = self.owners.shape
+        x0, y0, x1, y1 = box or (
+            template.ox,
+            template.oy,
+            template.ox + template.width,
+            template.oy + template.height,
+        )
+        x0, y0 = max(x0, template.ox, 0), max(y0, template.oy, 0)
+        x1 = min(x1, template.ox + template.width, width)
+        y1 = min(y1, template.oy + template.height, height)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        region = (slice(y0, y1), slice(x0, x1))
+        array = template.palettized_array[
+            y0 - template.oy : y1 - template.oy, x0 - template.ox : x1 - template.ox
+        ]
+        return region, array
+
+    def _paint(self, template, box=None) -> None:
+        """Layer the template (in `box`) on the pixels owned by templates above it."""
+        region = self._get_region(template, box)
+        if region is None:
+            return
+        region, array = region
+        owners = self.owners[region]
+        mask = array != 255
+        mask &= (owners == NO_OWNER) | (owners > template.id)
+        owners[mask] = template.id
+        self.colors[region][mask] = array[mask]
+
+    def add(self, template) -> None:
+        """Layer a template on the combo."""
+        self._templates[id(template)] = template
+        self._paint(template)
+
+    def remove(self, template) -> None:
+        """Remove a template from the combo and show the templates under it."""
+        if self._templates.pop(id(template), None) is None:
+            return
+        region = self._get_region(template)
+        if region is None:
+            return
+        region, _ = region
+        owners = self.owners[region]
+        freed = owners == template.id
+        if not np.any(freed):
+            return
+        owners[freed] = NO_OWNER
+        self.colors[region][freed] = 255
+        # paint again the templates overlapping the freed pixels, by z-order
+        y0, x0 = region[0].start, region[1].start
+        y1, x1 = region[0].stop, region[1].stop
+        for other in sorted(self._templates.values(), key=lambda t: t.id):
+            if (
+                other.ox < x1
+                and other.ox + other.width > x0
+                and other.oy < y1
+                and other.oy + other.height > y0
+            ):
+                self._paint(other, (x0, y0, x1, y1))
+
+    def get_array(self, placemap: np.ndarray = None) -> np.ndarray:
+        """Get a copy of the combo palette indexes, with the pixels outside of
+        the placemap made transparent if a placemap is given."""
+        array = self.colors.copy()
+        if placemap is not None and placemap.shape == array.shape:
+            array[placemap != 0] = 255
+        return array
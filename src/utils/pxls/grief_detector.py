@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import numpy as np
+
+# number of griefed pixels remembered per template
+RING_SIZE = 1024
+# an alert is raised when ALERT_THRESHOLD pixels of a template are griefed
+# in less than ALERT_WINDOW seconds
+ALERT_WINDOW = 5 * 60
+ALERT_THRESHOLD = 50
+# minimum time (in seconds) between 2 alerts for the same template
+ALERT_COOLDOWN = 30 * 60
+
+
+class GriefRing:
+    """A fixed-size ring buffer of the griefed pixels of a template:
+    the time, coordinates and new color of the pixels that went from correct
+    to wrong. Only the last `size` pixels are kept."""
+
+    def __init__(self, size: int = RING_SIZE) -> None:
+        self.size = size
+        self.times = np.zeros(size, dtype=np.uint32)
+        self.xs = np.zeros(size, dtype=np.int32)
+        self.ys = np.zeros(size, dtype=np.int32)
+        self.colors = np.zeros(size, dtype=np.uint8)
+        # total number of pixels written (the next pixel goes at count % size)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    def extend(self, timestamp: int, xs, ys, colors) -> None:
+        nb_pixels = len(xs)
+        if nb_pixels == 0:
+            return
+        # only the last pixels of the batch fit in the buffer
+        skipped = max(0, nb_pixels - self.size)
+        positions = (self.count + np.arange(skipped, nb_pixels)) % self.size
+        self.times[positions] = timestamp
+        self.xs[positions] = xs[skipped:]
+        self.ys[positions] = ys[skipped:]
+        self.colors[positions] = colors[skipped:]
+        self.count += nb_pixels
+
+    def _ordered_positions(self) -> np.ndarray:
+        """The positions of the pixels in the buffer from the oldest to the newest."""
+        start = max(0, self.count - self.size)
+        return np.arange(start, self.count) % self.size
+
+    def count_since(self, since: int) -> int:
+        return int(np.sum(self.times[: len(self)] >= since))
+
+    def get_since(self, since: int) -> tuple[np.ndarray, ...]:
+        """Get the (times, xs, ys, colors) of the pixels griefed since a timestamp,
+        from the oldest to the newest."""
+        positions = self._ordered_positions()
+        positions = positions[self.times[positions] >= since]
+        return (
+            self.times[positions],
+            self.xs[positions],
+            self.ys[positions],
+            self.colors[positions],
+        )
+
+
+class GriefDetector:
+    """Record the griefed pixels of the tracked templates and detect the templates
+    griefed faster than a threshold.
+
+    The pixels are recorded from the websocket thread and read from the bot loop."""
+
+    def __init__(
+        self,
+        window: int = ALERT_WINDOW,
+        threshold: int = ALERT_THRESHOLD,
+        cooldown: int = ALERT_COOLDOWN,
+        ring_size: int = RING_SIZE,
+    ) -> None:
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.ring_size = ring_size
+        # ring buffer and time of the last alert by template ID
+        self._rings: dict[int, GriefRing] = {}
+        self._last_alerts: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, template, timestamp: int, xs, ys, colors) -> None:
+        """Record pixels of a template that went from correct to wrong."""
+        if len(xs) == 0:
+            return
+        with self._lock:
+            ring = self._rings.get(template.id)
+            if ring is None:
+                ring = self._rings[template.id] = GriefRing(self.ring_size)
+            ring.extend(timestamp, xs, ys, colors)
+
+    def forget(self, template) -> None:
+        with self._lock:
+            self._rings.pop(template.id, None)
+            self._last_alerts.pop(template.id, None)
+
+    def count_griefed(self, template, seconds: float) -> int:
+        """Get the number of pixels of a template griefed in the last `seconds`."""
+        with self._lock:
+            ring = self._rings.get(template.id)
+            if ring is None:
+                return 0
+            return ring.count_since(int(time.time() - seconds))
+
+    def get_griefed_pixels(self, template, seconds: float) -> tuple[np.ndarray, ...]:
+        """Get the (times, xs, ys, colors) of the pixels of a template griefed in the
+        last `seconds` (only the last `ring_size` pixels are kept)."""
+        with self._lock:
+            ring = self._rings.get(template.id)
+            if ring is None:
+                # (empty arrays)
+                ring = GriefRing(1)
+            return ring.get_since(int(time.time() - seconds))
+
+    def get_alerts(self, templates: list) -> list[tuple[object, int]]:
+        """Get the templates griefed faster than the threshold that weren't alerted
+        recently, with their number of pixels griefed in the alert window.
+        The alerts returned are considered sent."""
+        now = time.time()
+        alerts = []
+        with self._lock:
+            for template in templates:
+                ring = self._rings.get(template.id)
+                if ring is None:
+                    continue
+                if now - self._last_alerts.get(template.id, 0) < self.cooldown:
+                    continue
+                nb_griefed = ring.count_since(int(now - self.window))
+                if nb_griefed >= self.threshold:
+                    self._last_alerts[template.id] = now
+                    alerts.append((template, nb_griefed))
+        return alerts
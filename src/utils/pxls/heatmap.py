@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import numpy as np
+
+# time (in seconds) for a pixel to go from full activity (255) to inactive (0),
+# used until the board info gives the canvas value
+DEFAULT_HEATMAP_COOLDOWN = 3 * 60 * 60
+
+
+class LocalHeatmap:
+    """An activity heatmap maintained locally from the websocket pixels.
+
+    It matches the pxls heatmap format: a uint8 array where a pixel placed right now
+    is 255 and then decays linearly to 0 over `cooldown` seconds.
+
+    Instead of decaying the whole array periodically, it stores the time at which
+    each pixel becomes inactive, so placing pixels only writes the placed pixels
+    and the decay is computed when the heatmap is read."""
+
+    def __init__(self, cooldown: float = DEFAULT_HEATMAP_COOLDOWN) -> None:
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._epoch = time.monotonic()
+        # time (in seconds since self._epoch) at which each pixel's activity reaches 0
+        self._expiry: np.ndarray = None
+
+    def _now(self) -> float:
+        return time.monotonic() - self._epoch
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._expiry is not None
+
+    def load(self, heatmap_array: np.ndarray, cooldown: float = None) -> None:
+        """Reconcile the local heatmap with a heatmap array fetched from pxls."""
+        if cooldown:
+            self.cooldown = cooldown
+        now = self._now()
+        expiry = heatmap_array.astype(np.float32)
+        expiry *= self.cooldown / 255
+        expiry += now
+        with self._lock:
+            self._expiry = expiry
+
+    def add_pixels(self, xs: np.ndarray, ys: np.ndarray) -> None:
+        """Set the activity of a batch of placed pixels to the maximum."""
+        with self._lock:
+            if self._expiry is None:
+                return
+            height, width = self._expiry.shape
+            in_bounds = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            self._expiry[ys[in_bounds], xs[in_bounds]] = self._now() + self.cooldown
+
+    def get_array(self) -> np.ndarray:
+        """Get the current heatmap as a uint8 array (None if it wasn't loaded yet)."""
+        with self._lock:
+            if self._expiry is None:
+                return None
+            remaining = self._expiry - self._now()
+        remaining *= 255 / self.cooldown
+        np.clip(remaining, 0, 255, out=remaining)
+        return np.ceil(remaining).astype(np.uint8)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+from utils.pxls.board_buffer import BoardChanges
+
+
+class LastChangeIndex:
+    """The time of the last change of every pixel on the canvas.
+
+    It is a uint32 array of unix timestamps with the board shape, updated with the
+    board changes from the websocket (0 = no change seen since the bot started).
+    Region activity queries are then a comparison on a crop of this array."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._times: np.ndarray = None
+
+    def update(self, changes: BoardChanges, timestamp: int) -> None:
+        """Set the last change time of the changed pixels to `timestamp`."""
+        with self._lock:
+            if self._times is None or self._times.shape != changes.shape:
+                self._times = np.zeros(changes.shape, dtype=np.uint32)
+            self._times.reshape(-1)[changes.flat_indexes] = timestamp
+
+    def crop(self, ox: int, oy: int, width: int, height: int) -> np.ndarray:
+        """Get the last change times in the area of size (width, height) at (ox, oy).
+        The parts of the area outside the canvas are filled with 0."""
+        res = np.zeros((height, width), dtype=np.uint32)
+        with self._lock:
+            if self._times is None:
+                return res
+            y0 = min(max(0, oy), self._times.shape[0])
+            y1 = max(0, min(self._times.shape[0], oy + height))
+            x0 = min(max(0, ox), self._times.shape[1])
+            x1 = max(0, min(self._times.shape[1], ox + width))
+            res[y0 - oy : y1 - oy, x0 - ox : x1 - ox] = self._times[y0:y1, x0:x1]
+        return res
+
+    def changed_since(
+        self, timestamp: int, ox: int, oy: int, width: int, height: int, mask=None
+    ) -> np.ndarray:
+        """Get a mask of the pixels changed since `timestamp` in an area,
+        restricted to the pixels of `mask` if one is given."""
+        changed_mask = self.crop(ox, oy, width, height) >= max(1, timestamp)
+        if mask is not None:
+            changed_mask &= mask
+        return changed_mask
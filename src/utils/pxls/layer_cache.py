@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Hashable
+
+import numpy as np
+
+
+class LayerCache:
+    """A cache of the arrays derived from the boards (placeable board, non-virgin
+    board, ...), so they are computed at most once per board change.
+
+    Each layer is stored with the key it was computed for (the versions of the
+    boards it depends on) and is recomputed only when it is requested with a
+    different key. The cached arrays are read-only so they can be shared between
+    the commands using them."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # layer name -> (key, array)
+        self._layers: dict[str, tuple[Hashable, np.ndarray]] = {}
+        # layer name -> lock held while the layer is computed
+        self._layer_locks: dict[str, threading.Lock] = {}
+
+    def get(
+        self, name: str, key: Hashable, compute: Callable[[], np.ndarray]
+    ) -> np.ndarray:
+        """Get the layer `name` for `key`, calling `compute` if it isn't cached."""
+        with self._lock:
+            layer_lock = self._layer_locks.setdefault(name, threading.Lock())
+        with layer_lock:
+            cached = self._layers.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            array = compute()
+            array.flags.writeable = False
+            self._layers[name] = (key, array)
+            return array
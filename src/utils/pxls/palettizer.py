@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageColor
+
+# palette index used for the transparent pixels
+TRANSPARENT_INDEX = 255
+
+
+@lru_cache(maxsize=32)
+def get_palette_lut(palette: tuple[str, ...]) -> np.ndarray:
+    """Build the lookup table of a palette of hex colors: a (N, 4) uint8 RGBA array
+    with N >= 256, the color of palette index i is at row i.
+
+    The indexes without a color and the index 255 are transparent."""
+    lut = np.zeros((max(256, len(palette)), 4), dtype=np.uint8)
+    for i, color in enumerate(palette):
+        lut[i] = ImageColor.getcolor(color, "RGBA")
+    lut[TRANSPARENT_INDEX] = (0, 0, 0, 0)
+    lut.flags.writeable = False
+    return lut
+
+
+def palettize(array: np.ndarray, palette: tuple[str, ...]) -> np.ndarray:
+    """Convert an array of palette indexes to a RGBA array with the palette lookup table."""
+    lut = get_palette_lut(tuple(palette))
+    array = np.asarray(array)
+    if array.dtype != np.uint8:
+        # indexes outside the lookup table are transparent
+        array = np.where(
+            (array >= 0) & (array < len(lut)), array, TRANSPARENT_INDEX
+        ).astype(np.intp)
+    return lut[array]
+
+
+def palettize_image(array: np.ndarray, palette: tuple[str, ...]) -> Image.Image:
+    """Convert an array of palette indexes to a palette mode ("P") image.
+
+    The palette and the transparency of each index are attached to the image, so it
+    keeps 1 byte per pixel until it is encoded. Arrays that can't fit in 256 colors
+    are converted to a RGBA image instead."""
+    lut = get_palette_lut(tuple(palette))
+    array = np.asarray(array)
+    if array.dtype != np.uint8 and (
+        len(palette) > 256 or array.size and (array.min() < 0 or array.max() > 255)
+    ):
+        return Image.fromarray(palettize(array, palette))
+    return _indexes_to_image(array, lut[:256])
+
+
+def _indexes_to_image(array: np.ndarray, lut: np.ndarray) -> Image.Image:
+    image = Image.fromarray(np.ascontiguousarray(array, dtype=np.uint8))
+    image.putpalette(lut[:, :3].tobytes())
+    image.info["transparency"] = lut[:, 3].tobytes()
+    return image
+
+
+def highlight_palettized_image(
+    top_array: np.ndarray,
+    background_array: np.ndarray,
+    top_palette: tuple[str, ...],
+    background_palette: tuple[str, ...],
+    opacity=0.2,
+    background_color=(0, 0, 0),
+) -> Image.Image:
+    """Palette mode version of `highlight_image`: draw the `top_array` indexes over
+    the `background_array` indexes with the background colors faded to `opacity`
+    over `background_color`.
+
+    The image palette is the top palette followed by the faded background palette,
+    return None if they don't fit in 255 colors."""
+    nb_top = len(top_palette)
+    nb_background = len(background_palette)
+    if nb_top + nb_background > TRANSPARENT_INDEX:
+        return None
+    top_lut = get_palette_lut(tuple(top_palette))
+    background_lut = get_palette_lut(tuple(background_palette))
+
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[:nb_top] = top_lut[:nb_top]
+    faded = background_lut[:nb_background, :3] * opacity + np.multiply(
+        background_color[:3], 1 - opacity
+    )
+    lut[nb_top : nb_top + nb_background, :3] = np.rint(faded)
+    lut[nb_top : nb_top + nb_background, 3] = background_lut[:nb_background, 3]
+
+    res = np.full(top_array.shape, TRANSPARENT_INDEX, dtype=np.uint8)
+    background_mask = background_array < nb_background
+    res[background_mask] = background_array[background_mask] + nb_top
+    top_mask = top_array < nb_top
+    res[top_mask] = top_array[top_mask]
+    return _indexes_to_image(res, lut)
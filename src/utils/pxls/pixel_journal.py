@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import os
+from typing import BinaryIO, Iterator
+
+import numpy as np
+
+from utils.pxls.board_buffer import last_occurrences
+
+# a journal record: unix timestamp (seconds), coordinates and color index
+JOURNAL_RECORD = np.dtype([("time", "<u4"), ("x", "<u2"), ("y", "<u2"), ("color", "u1")])
+# maximum number of records in a segment file (~9MB per segment)
+SEGMENT_RECORDS = 1 << 20
+# maximum number of segment files kept in the journal (all canvases included)
+MAX_SEGMENTS = 64
+
+
+def in_bounds(records: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """Get a mask of the records inside a board of the given shape."""
+    return (records["x"] < shape[1]) & (records["y"] < shape[0])
+
+
+def to_flat_indexes(records: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """Convert the records coordinates to indexes in a flattened board."""
+    return records["y"].astype(np.intp) * shape[1] + records["x"]
+
+
+class PixelJournal:
+    """An append-only journal of the pixels placed on the canvas.
+
+    The records are saved per canvas code in fixed-size binary segment files:
+    `<folder>/<canvas_code>/<segment_index>.bin`, a new segment is started when
+    the current one has `segment_records` records. Only the last `max_segments`
+    segments are kept, the oldest ones are deleted when a new segment is started.
+    The segments are read with memory mapping, so scans over the journal are
+    numpy operations on the files without loading them in memory."""
+
+    def __init__(
+        self,
+        folder: str,
+        segment_records: int = SEGMENT_RECORDS,
+        max_segments: int = MAX_SEGMENTS,
+    ) -> None:
+        self.folder = folder
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        # canvas code -> (index of the segment being written, number of records in it)
+        self._current_segments: dict[str, tuple[int, int]] = {}
+        # canvas code -> segment file being written, kept open between batches
+        self._open_files: dict[str, BinaryIO] = {}
+
+    def _canvas_folder(self, canvas_code: str) -> str:
+        return os.path.join(self.folder, str(canvas_code))
+
+    def _segment_path(self, canvas_code: str, segment_index: int) -> str:
+        return os.path.join(self._canvas_folder(canvas_code), f"{segment_index:06d}.bin")
+
+    def segments(self, canvas_code: str) -> list[str]:
+        """Get the paths of all the segments of a canvas, in order."""
+        folder = self._canvas_folder(canvas_code)
+        if not os.path.isdir(folder):
+            return []
+        names = sorted(f for f in os.listdir(folder) if f.endswith(".bin"))
+        return [os.path.join(folder, name) for name in names]
+
+    def _get_current_segment(self, canvas_code: str) -> tuple[int, int]:
+        if canvas_code in self._current_segments:
+            return self._current_segments[canvas_code]
+        segments = self.segments(canvas_code)
+        if not segments:
+            os.makedirs(self._canvas_folder(canvas_code), exist_ok=True)
+            current = (0, 0)
+        else:
+            last_segment = segments[-1]
+            segment_index = int(os.path.basename(last_segment)[:-4])
+            size = os.path.getsize(last_segment)
+            nb_records = size // JOURNAL_RECORD.itemsize
+            if size % JOURNAL_RECORD.itemsize != 0:
+                # drop the partial record of an interrupted write
+                os.truncate(last_segment, nb_records * JOURNAL_RECORD.itemsize)
+            current = (segment_index, nb_records)
+        self._current_segments[canvas_code] = current
+        return current
+
+    def _open_segment(self, canvas_code: str, segment_index: int) -> BinaryIO:
+        """Get the file of the segment being written, closing the previous segment
+        (and the segments of the other canvases) if it changed."""
+        path = self._segment_path(canvas_code, segment_index)
+        f = self._open_files.get(canvas_code)
+        if f is not None and f.name == path:
+            return f
+        self.close()
+        f = open(path, "ab")
+        self._open_files[canvas_code] = f
+        self._prune_segments(keep=path)
+        return f
+
+    def _prune_segments(self, keep: str) -> None:
+        """Delete the oldest segments of the journal to keep at most `max_segments`."""
+        if not os.path.isdir(self.folder):
+            return
+        segments = []
+        for canvas_code in os.listdir(self.folder):
+            segments += [
+                (os.path.getmtime(path), path)
+                for path in self.segments(canvas_code)
+                if path != keep
+            ]
+        segments.sort()
+        for _, path in segments[: max(0, len(segments) - self.max_segments + 1)]:
+            os.remove(path)
+            folder = os.path.dirname(path)
+            if not os.listdir(folder):
+                os.rmdir(folder)
+
+    def close(self) -> None:
+        """Close the segment files being written."""
+        for f in self._open_files.values():
+            f.close()
+        self._open_files.clear()
+
+    def append(self, canvas_code: str, times, xs, ys, colors) -> None:
+        """Append a batch of pixels to the journal of a canvas
+        (pixels with negative coordinates are ignored)."""
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        valid = (xs >= 0) & (ys >= 0)
+        records = np.empty(int(np.sum(valid)), dtype=JOURNAL_RECORD)
+        records["time"] = np.broadcast_to(times, xs.shape)[valid]
+        records["x"] = xs[valid]
+        records["y"] = ys[valid]
+        records["color"] = np.broadcast_to(colors, xs.shape)[valid]
+
+        segment_index, nb_records = self._get_current_segment(canvas_code)
+        start = 0
+        while start < len(records):
+            if nb_records >= self.segment_records:
+                segment_index += 1
+                nb_records = 0
+            end = start + self.segment_records - nb_records
+            chunk = records[start:end]
+            f = self._open_segment(canvas_code, segment_index)
+            f.write(chunk.tobytes())
+            f.flush()
+            nb_records += len(chunk)
+            start += len(chunk)
+        self._current_segments[canvas_code] = (segment_index, nb_records)
+
+    @staticmethod
+    def read_segment(path: str) -> np.ndarray:
+        """Memory map a segment file as a read-only record array."""
+        nb_records = os.path.getsize(path) // JOURNAL_RECORD.itemsize
+        if nb_records == 0:
+            return np.empty(0, dtype=JOURNAL_RECORD)
+        return np.memmap(path, dtype=JOURNAL_RECORD, mode="r", shape=(nb_records,))
+
+    def iter_records(
+        self, canvas_code: str, start_time: int = None, end_time: int = None
+    ) -> Iterator[np.ndarray]:
+        """Iterate over the journal of a canvas segment by segment, yielding the
+        records with `start_time <= time < end_time` (unix timestamps)."""
+        for path in self.segments(canvas_code):
+            records = self.read_segment(path)
+            if len(records) == 0:
+                continue
+            if start_time is not None and records["time"][-1] < start_time:
+                continue
+            if end_time is not None and records["time"][0] >= end_time:
+                break
+            if start_time is not None and records["time"][0] < start_time:
+                records = records[records["time"] >= start_time]
+            if end_time is not None and records["time"][-1] >= end_time:
+                records = records[records["time"] < end_time]
+            yield records
+
+    def reconstruct_board(
+        self,
+        canvas_code: str,
+        base_board: np.ndarray,
+        start_time: int = None,
+        end_time: int = None,
+    ) -> np.ndarray:
+        """Replay the journal between 2 timestamps on top of a copy of `base_board`
+        (the board at `start_time`) and return the board at `end_time`."""
+        board = base_board.copy()
+        flat_board = board.reshape(-1)
+        for records in self.iter_records(canvas_code, start_time, end_time):
+            records = records[in_bounds(records, board.shape)]
+            flat_indexes = to_flat_indexes(records, board.shape)
+            last_indexes = last_occurrences(flat_indexes)
+            flat_board[flat_indexes[last_indexes]] = records["color"][last_indexes]
+        return board
+
+    def activity_map(
+        self,
+        canvas_code: str,
+        shape: tuple[int, int],
+        start_time: int = None,
+        end_time: int = None,
+    ) -> np.ndarray:
+        """Count the number of pixels placed at each coordinate between 2 timestamps."""
+        height, width = shape
+        counts = np.zeros(height * width, dtype=np.int64)
+        for records in self.iter_records(canvas_code, start_time, end_time):
+            records = records[in_bounds(records, shape)]
+            flat_indexes = to_flat_indexes(records, shape)
+            counts += np.bincount(flat_indexes, minlength=height * width)
+        return counts.reshape(shape)
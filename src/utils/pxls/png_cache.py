@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Hashable
+
+from PIL import Image
+
+# number of encoded images kept in the cache
+MAX_ENTRIES = 8
+
+
+def encode_png(make_image: Callable[[], Image.Image]) -> bytes:
+    """Make an image and encode it as PNG."""
+    with BytesIO() as image_binary:
+        make_image().save(image_binary, "PNG")
+        return image_binary.getvalue()
+
+
+class EncodedImageCache:
+    """A cache of encoded PNG images of the boards.
+
+    The images are keyed by (board versions, layer, scale) so an image is encoded
+    once per board change and the bytes are reused by every command and snapshot
+    channel sending it. Concurrent requests for the same key wait for the same
+    encoding instead of encoding it again."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, asyncio.Future] = OrderedDict()
+
+    async def get(self, key: Hashable, make_image: Callable[[], Image.Image]) -> bytes:
+        """Get the PNG bytes for `key`, encoding the image returned by `make_image`
+        in an executor if it isn't cached."""
+        entry = self._entries.get(key)
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            entry = loop.run_in_executor(None, encode_png, make_image)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        try:
+            return await asyncio.shield(entry)
+        except Exception:
+            # don't keep the failed encodings
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            raise
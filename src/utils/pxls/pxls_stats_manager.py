@@ -1,13 +1,24 @@
 import math
+import time
 import uuid
 from datetime import datetime
+from functools import partial
 
 import numpy as np
 import pytz
-from PIL import ImageColor
 
 from utils.log import get_logger
-from utils.utils import get_content
+from utils.pxls.board_buffer import BoardBuffer, BoardChanges, decode_board
+from utils.pxls.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.pxls.color_counts import ColorCounts
+from utils.pxls.heatmap import LocalHeatmap
+from utils.pxls.last_change import LastChangeIndex
+from utils.pxls.layer_cache import LayerCache
+from utils.pxls.palettizer import palettize, palettize_image
+from utils.pxls.png_cache import EncodedImageCache
+from utils.pxls.stats_index import StatsIndex
+from utils.pxls.tile_pyramid import TilePyramid
+from utils.utils import BadResponseError, get_content
 
 logger = get_logger(__name__)
 
@@ -15,24 +26,47 @@ logger = get_logger(__name__)
 class PxlsStatsManager:
     """A helper to get data from pxls.space/stats"""
 
-    def __init__(self, db_conn):
-        self.base_url = "https://pxls.space/"
+    def __init__(self, db_conn, base_url="https://pxls.space/"):
+        self.base_url = base_url
         self.stats_json = {}
+        # the stats.json toplists indexed by username
+        self.stats_index = StatsIndex(self.stats_json)
         self.board_info = {}
         self.current_canvas_code = None
         self.online_count = None
         self.db_conn = db_conn
-
-        self.board_array = None
-        self.virginmap_array = None
-        self.placemap_array = None
         self.palette = None
 
+        # versioned boards updated by the board refresh and the websocket
+        self.board_buffer = BoardBuffer()
+        self.virginmap_buffer = BoardBuffer()
+        self.placemap_buffer = BoardBuffer()
+        # activity heatmap updated by the websocket
+        self.heatmap = LocalHeatmap()
+        # time of the last change of each pixel
+        self.last_change = LastChangeIndex()
+        # number of pixels of each color
+        self.color_counts = ColorCounts(
+            self.board_buffer, self.placemap_buffer, self.virginmap_buffer
+        )
+        # downscaled tiles of the board for the thumbnails
+        self.board_pyramid = TilePyramid(self.board_buffer)
+        # arrays derived from the boards, cached per board versions
+        self.layers = LayerCache()
+        # encoded PNG images of the boards, cached per board versions
+        self.png_cache = EncodedImageCache()
+        # circuit breaker of each pxls endpoint
+        self.breakers: dict[str, CircuitBreaker] = {}
+        # last good payload of the endpoints that can be served stale: (time, payload)
+        self.last_payloads = {}
+        # functions called with the BoardChanges every time the board changes
+        self.board_listeners = []
+
     async def refresh(self):
 
         status = False
         try:
-            self.board_info = await self.query("info", "json")
+            self.board_info = await self.query("info", "json", allow_stale=True)
         except ValueError as e:
             logger.error(f"Couldn't update board info: {e}")
         except Exception:
@@ -48,7 +82,10 @@ class PxlsStatsManager:
             logger.exception("Couldn't fetch online count:")
 
         try:
-            self.stats_json = await self.query("stats/stats.json", "json")
+            stats_json = await self.query("stats/stats.json", "json", allow_stale=True)
+            if stats_json is not self.stats_json:
+                self.stats_json = stats_json
+                self.stats_index = StatsIndex(stats_json)
             status = True
         except ValueError as e:
             logger.error(f"Couldn't update stats.json: {e}")
@@ -61,6 +98,26 @@ class PxlsStatsManager:
             logger.exception("Couldn't update the palette:")
         return status
 
+    @property
+    def board_array(self):
+        """A read-only snapshot of the current board (or None if not fetched yet)"""
+        return self.board_buffer.array
+
+    @property
+    def virginmap_array(self):
+        """A read-only snapshot of the current virginmap (or None if not fetched yet)"""
+        return self.virginmap_buffer.array
+
+    @property
+    def placemap_array(self):
+        """A read-only snapshot of the current placemap (or None if not fetched yet)"""
+        return self.placemap_buffer.array
+
+    def get_board_snapshot(self):
+        """Get the current board version and a read-only snapshot of the board.
+        The version increases every time the board changes."""
+        return self.board_buffer.snapshot()
+
     def get_general_stats(self):
         general = self.stats_json["general"].copy()
         general.pop("nth_list")
@@ -80,18 +137,10 @@ class PxlsStatsManager:
         return date_time_obj
 
     def get_alltime_stat(self, name):
-        at_table = self.stats_json["toplist"]["alltime"]
-        for user in at_table:
-            if user["username"] == name:
-                return user["pixels"]
-        return None
+        return self.stats_index.alltime.get_pixels(name)
 
     def get_canvas_stat(self, name):
-        at_table = self.stats_json["toplist"]["canvas"]
-        for user in at_table:
-            if user["username"] == name:
-                return user["pixels"]
-        return None
+        return self.stats_index.canvas.get_pixels(name)
 
     def get_all_alltime_stats(self):
         return self.stats_json["toplist"]["alltime"]
@@ -184,83 +233,212 @@ class PxlsStatsManager:
         """Convert a numpy array of palette indexes to a color numpy array
         (RGBA). If a palette is given, it will be used to map the array, if not
         the current pxls palette will be used"""
-        colors_list = []
-        if not palette:
-            palette = [f"#{c['value']}" for c in self.get_palette(restricted=True)]
-        for color in palette:
-            rgb = ImageColor.getcolor(color, "RGBA")
-            colors_list.append(rgb)
-        colors_dict = dict(enumerate(colors_list))
-        colors_dict[255] = (0, 0, 0, 0)
-
-        img = np.stack(np.vectorize(colors_dict.get)(array), axis=-1)
-        return img.astype(np.uint8)
+        return palettize(array, palette or self.get_hex_palette())
+
+    def get_hex_palette(self):
+        """Get the current pxls palette as a list of hex colors"""
+        return [f"#{c['value']}" for c in self.get_palette(restricted=True)]
+
+    def palettize_image(self, array, palette=None):
+        """Convert a numpy array of palette indexes to a palette mode PIL image
+        (with index 255 transparent), using the current pxls palette if no palette
+        is given"""
+        return palettize_image(array, palette or self.get_hex_palette())
 
     async def fetch_board(self):
         "fetch the board with a get request"
         board_bytes = await self.query("boarddata", "bytes")
-        board_array = np.asarray(list(board_bytes), dtype=np.uint8).reshape(
-            self.board_info["height"], self.board_info["width"]
+        board_array = self.board_buffer.load(
+            board_bytes, self.board_info["height"], self.board_info["width"]
         )
-        self.board_array = board_array
+        # the board may have pixels missed by the websocket
+        self.notify_board_listeners(None)
         return board_array
 
     async def fetch_virginmap(self):
         "fetch the virgin map with a get request"
         board_bytes = await self.query("virginmap", "bytes")
-        board_array = np.asarray(list(board_bytes), dtype=np.uint8).reshape(
-            self.board_info["height"], self.board_info["width"]
+        return self.virginmap_buffer.load(
+            board_bytes, self.board_info["height"], self.board_info["width"]
         )
-        self.virginmap_array = board_array
-        return board_array
 
     async def fetch_heatmap(self):
-        "fetch the heatmap with a get request"
+        """fetch the heatmap with a get request and reconcile the local heatmap with it
+        (the array returned is read-only)"""
         board_bytes = await self.query("heatmap", "bytes")
-        board_array = np.asarray(list(board_bytes), dtype=np.uint8).reshape(
-            self.board_info["height"], self.board_info["width"]
+        heatmap_array = decode_board(
+            board_bytes, self.board_info["height"], self.board_info["width"]
         )
-        return board_array
+        self.heatmap.load(heatmap_array, self.board_info.get("heatmapCooldown"))
+        return heatmap_array
+
+    async def get_heatmap(self):
+        """get the heatmap maintained locally from the websocket pixels
+        (fetch it if it wasn't loaded yet)"""
+        heatmap_array = self.heatmap.get_array()
+        if heatmap_array is None:
+            heatmap_array = await self.fetch_heatmap()
+        return heatmap_array
 
     async def fetch_initial_canvas(self):
-        "fetch the initial canvas with a get request"
-        board_bytes = await self.query("initialboarddata", "bytes")
-        board_array = np.asarray(list(board_bytes), dtype=np.uint8).reshape(
-            self.board_info["height"], self.board_info["width"]
+        "fetch the initial canvas with a get request (the array returned is read-only)"
+        board_bytes = await self.query("initialboarddata", "bytes", allow_stale=True)
+        return decode_board(
+            board_bytes, self.board_info["height"], self.board_info["width"]
         )
-        return board_array
 
     async def fetch_placemap(self):
         "fetch the placemap with a get request"
         board_bytes = await self.query("placemap", "bytes")
-        board_array = np.asarray(list(board_bytes), dtype=np.uint8).reshape(
-            self.board_info["height"], self.board_info["width"]
+        return self.placemap_buffer.load(
+            board_bytes, self.board_info["height"], self.board_info["width"]
         )
-        self.placemap_array = board_array
-        return board_array
+
+    def _get_layer(self, name, buffers, compute):
+        """Get a layer derived from the snapshots of `buffers`,
+        it is only computed again when one of the buffers changed"""
+        snapshots = [buffer.snapshot() for buffer in buffers]
+        key = tuple(version for version, _ in snapshots)
+        return self.layers.get(name, key, lambda: compute(*(a for _, a in snapshots)))
 
     async def get_placable_board(self):
-        """fetch the board as an index array and use the placemap as a mask"""
-        canvas_array = self.board_array
-        placemap_array = self.placemap_array
-        placeable_board = canvas_array.copy()
-        placeable_board[placemap_array != 0] = 255
-        placeable_board[placemap_array == 0] = canvas_array[placemap_array == 0]
+        """Get a read-only board index array with the unplaceable pixels set to 255"""
+        return self.get_placeable_board_layer()
 
-        return placeable_board
+    def get_placeable_board_layer(self):
+        def compute(canvas_array, placemap_array):
+            return np.where(placemap_array != 0, np.uint8(255), canvas_array)
 
-    def update_board_pixel(self, x, y, color):
-        self.board_array[y, x] = color
+        return self._get_layer(
+            "placeable_board", [self.board_buffer, self.placemap_buffer], compute
+        )
 
-    def update_virginmap_pixel(self, x, y, color):
-        self.virginmap_array[y, x] = 0
+    def get_nonvirgin_board(self):
+        """Get a read-only board index array with only the non-virgin placeable pixels
+        (the other pixels are set to 255)"""
 
-    async def query(self, endpoint, content_type):
-        url = self.base_url + endpoint
+        def compute(canvas_array, placemap_array, virginmap_array):
+            mask = (placemap_array != 0) | (virginmap_array != 0)
+            return np.where(mask, np.uint8(255), canvas_array)
 
-        pxls_validate = str(uuid.uuid4())
-        cookies = {"pxls-validate": pxls_validate}
-        return await get_content(url, content_type, cookies=cookies)
+        return self._get_layer(
+            "nonvirgin_board",
+            [self.board_buffer, self.placemap_buffer, self.virginmap_buffer],
+            compute,
+        )
+
+    def get_virginmap_layer(self):
+        """Get a read-only index array of the virginmap: 0 = non-virgin, 1 = virgin,
+        255 = unplaceable"""
+
+        def compute(placemap_array, virginmap_array):
+            array = np.where(virginmap_array == 255, np.uint8(1), virginmap_array)
+            array[placemap_array != 0] = 255
+            return array
+
+        return self._get_layer(
+            "virginmap", [self.placemap_buffer, self.virginmap_buffer], compute
+        )
+
+    async def get_board_png(self, layer="board", max_size=None) -> bytes:
+        """Get a board layer encoded as PNG: "board", "nonvirgin" or "virginmap"
+        (the board is downscaled to fit in `max_size` if one is given).
+
+        The encoded images are cached per board versions."""
+        palette = None
+        if layer == "board":
+            buffers = [self.board_buffer]
+            if max_size:
+                get_array = partial(self.board_pyramid.get_thumbnail, max_size)
+            else:
+                get_array = partial(self.board_pyramid.get_level, 0)
+        elif layer == "nonvirgin":
+            buffers = [self.board_buffer, self.placemap_buffer, self.virginmap_buffer]
+            get_array = self.get_nonvirgin_board
+        elif layer == "virginmap":
+            buffers = [self.placemap_buffer, self.virginmap_buffer]
+            get_array = self.get_virginmap_layer
+            palette = ["#000000", "#00DD00"]
+        else:
+            raise ValueError(f"Unknown board layer: {layer}")
+        palette = palette or self.get_hex_palette()
+        versions = tuple(buffer.version for buffer in buffers)
+        key = (versions, layer, max_size, tuple(palette))
+        return await self.png_cache.get(
+            key, lambda: palettize_image(get_array(), palette)
+        )
+
+    def update_pixels(self, xs, ys, colors):
+        """Apply a batch of pixels placed on the canvas on the board, virginmap,
+        heatmap, last change index, board tiles and color counts"""
+        changes = self.board_buffer.set_pixels(xs, ys, colors)
+        if changes is not None:
+            self.last_change.update(changes, int(time.time()))
+            self.board_pyramid.invalidate(changes)
+        virginmap_changes = self.virginmap_buffer.set_pixels(xs, ys, 0)
+        self.color_counts.update(changes, virginmap_changes)
+        self.heatmap.add_pixels(xs, ys)
+        if changes is not None:
+            self.notify_board_listeners(changes)
+
+    def add_board_listener(self, listener):
+        """Register a function called with the BoardChanges every time pixels change
+        on the board (or with None when the whole board was replaced).
+        It can be called from the websocket thread."""
+        self.board_listeners.append(listener)
+
+    def notify_board_listeners(self, changes: BoardChanges):
+        for listener in self.board_listeners:
+            try:
+                listener(changes)
+            except Exception:
+                logger.exception("Board listener raised")
+
+    def get_color_counts(self):
+        """Get the number of placeable pixels and of non-virgin placeable pixels
+        of each color as 2 arrays indexed by color index (None if the boards
+        weren't fetched yet)"""
+        return self.color_counts.get_counts()
+
+    async def query(self, endpoint, content_type, allow_stale=False):
+        """Get a pxls endpoint.
+
+        The requests are skipped while the endpoint is unhealthy (CircuitOpenError
+        is raised right away). With `allow_stale`, the last good payload is returned
+        instead of raising when the endpoint is unhealthy or the request fails
+        (its age is given by `get_stale_age(endpoint)`)."""
+        breaker = self.breakers.setdefault(endpoint, CircuitBreaker())
+        try:
+            if not breaker.allow_request():
+                raise CircuitOpenError(f"pxls.space/{endpoint} is unreachable.")
+            url = self.base_url + endpoint
+            pxls_validate = str(uuid.uuid4())
+            cookies = {"pxls-validate": pxls_validate}
+            try:
+                payload = await get_content(url, content_type, cookies=cookies)
+            except (ValueError, BadResponseError):
+                breaker.record_failure()
+                raise
+        except (ValueError, BadResponseError) as e:
+            if allow_stale and endpoint in self.last_payloads:
+                logger.warning(f"Serving a stale payload for {endpoint}: {e}")
+                return self.last_payloads[endpoint][1]
+            raise
+        breaker.record_success()
+        if allow_stale:
+            self.last_payloads[endpoint] = (time.time(), payload)
+        return payload
+
+    def get_stale_age(self, endpoint):
+        """Get the age (in seconds) of the last good payload of an endpoint
+        if the endpoint is currently failing (None if it is healthy)"""
+        breaker = self.breakers.get(endpoint)
+        if breaker is None or breaker.failures == 0:
+            return None
+        last_payload = self.last_payloads.get(endpoint)
+        if last_payload is None:
+            return None
+        return time.time() - last_payload[0]
 
     def get_cd(self, online_count: int, multiplier: float = None):
         """Get the cooldown for a given amount of online users"""
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class Toplist:
+    """A stats.json toplist indexed by lowercase username.
+
+    The pixel counts are kept in a numpy array and each username is mapped to its
+    position, so the lookups don't scan the list."""
+
+    def __init__(self, entries: list) -> None:
+        self.entries = entries
+        self._positions = {}
+        for i, entry in enumerate(entries):
+            self._positions.setdefault(str(entry["username"]).lower(), i)
+        self.pixels = np.array([entry["pixels"] for entry in entries], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get_pixels(self, username: str) -> int:
+        """Get the pixel count of a user (None if not in the toplist)"""
+        position = self._positions.get(username.lower())
+        if position is None:
+            return None
+        return int(self.pixels[position])
+
+
+class StatsIndex:
+    """The toplists of a stats.json payload, indexed once per refresh."""
+
+    def __init__(self, stats_json: dict) -> None:
+        toplist = stats_json.get("toplist", {})
+        self.alltime = Toplist(toplist.get("alltime", []))
+        self.canvas = Toplist(toplist.get("canvas", []))
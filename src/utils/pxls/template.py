@@ -139,6 +139,7 @@ def stylize(style, stylesize, palette, glow_opacity=0):
 @jit(
     nopython=True,
     cache=True,
+    nogil=True,
     locals={"color_bit": types.uint64, "mapped_color_idx": types.uint8},
 )
 def _fast_reduce(array, palette, dist_func):
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class TemplateCache:
+    """A content-addressed cache of the parsed template images on disk.
+
+    The palette index arrays are saved in `.npy` files named after the hash of
+    what they were made from: the image content, the template width and the palette.
+    An index maps each image URL to the hash of its last downloaded content, so a
+    template can be loaded from its URL without downloading the image.
+
+    The other template parameters (coordinates, title, ...) are in the template URL,
+    so they don't need to be cached.
+
+    The cache is used from several threads: only the index is read and updated
+    under a lock, the arrays are hashed, loaded and saved outside of it."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.index_path = os.path.join(path, "index.json")
+        self._index: dict[str, str] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hash_image(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    @staticmethod
+    def get_key(image_hash: str, true_width: int, palette: list[str]) -> str:
+        """Get the key of a parsed template array"""
+        source = f"{image_hash}:{true_width}:{','.join(palette)}"
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def _get_array_path(self, key: str) -> str:
+        return os.path.join(self.path, "arrays", f"{key}.npy")
+
+    def _load_index(self) -> dict[str, str]:
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read the template cache index: {e}")
+                self._index = {}
+        return self._index
+
+    def _save_index(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _set_image_hash(self, image_url: str, image_hash: str) -> None:
+        with self._lock:
+            index = self._load_index()
+            if index.get(image_url) != image_hash:
+                index[image_url] = image_hash
+                self._save_index()
+
+    def get(
+        self, image_url: str, true_width: int, palette: list[str], image_bytes=None
+    ) -> np.ndarray:
+        """Get the palette index array of a template image.
+
+        If `image_bytes` is given, the array of this image content is returned,
+        else the array of the last content downloaded from `image_url` is returned.
+        Return None if the array isn't in the cache."""
+        if image_bytes is not None:
+            image_hash = self.hash_image(image_bytes)
+        else:
+            with self._lock:
+                image_hash = self._load_index().get(image_url)
+            if image_hash is None:
+                return None
+        key = self.get_key(image_hash, true_width, palette)
+        try:
+            array = np.load(self._get_array_path(key), allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Couldn't read the cached template {key}: {e}")
+            return None
+        if image_bytes is not None:
+            self._set_image_hash(image_url, image_hash)
+        return array
+
+    def put(
+        self,
+        image_url: str,
+        image_bytes: bytes,
+        true_width: int,
+        palette: list[str],
+        array: np.ndarray,
+    ) -> None:
+        """Save the palette index array made from an image downloaded from `image_url`."""
+        image_hash = self.hash_image(image_bytes)
+        key = self.get_key(image_hash, true_width, palette)
+        array_path = self._get_array_path(key)
+        if not os.path.exists(array_path):
+            os.makedirs(os.path.dirname(array_path), exist_ok=True)
+            # (a unique temporary file, the same image can be saved by 2 threads)
+            fd, tmp_path = tempfile.mkstemp(
+                suffix=".tmp", dir=os.path.dirname(array_path)
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, array, allow_pickle=False)
+                os.replace(tmp_path, array_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        self._set_image_hash(image_url, image_hash)
+
+    def prune(self, templates: list[tuple[str, int, list[str]]]) -> int:
+        """Remove the arrays and the index entries that aren't used by a list of
+        templates given as (image URL, true width, palette).
+        Return the number of arrays removed."""
+        with self._lock:
+            index = self._load_index()
+            image_urls = {image_url for image_url, _, _ in templates}
+            if any(image_url not in image_urls for image_url in index):
+                self._index = {
+                    image_url: image_hash
+                    for image_url, image_hash in index.items()
+                    if image_url in image_urls
+                }
+                self._save_index()
+            keys = {
+                self.get_key(self._index[image_url], true_width, palette)
+                for image_url, true_width, palette in templates
+                if image_url in self._index
+            }
+        arrays_path = os.path.join(self.path, "arrays")
+        try:
+            filenames = os.listdir(arrays_path)
+        except FileNotFoundError:
+            return 0
+        nb_removed = 0
+        for filename in filenames:
+            key, ext = os.path.splitext(filename)
+            if ext != ".npy" or key in keys:
+                continue
+            try:
+                os.remove(os.path.join(arrays_path, filename))
+                nb_removed += 1
+            except FileNotFoundError:
+                pass
+        return nb_removed
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+# size (in pixels) of the square cells of the index
+CELL_SIZE = 64
+# the cell keys are packed in a single int: cell_y << CELL_KEY_BITS | cell_x
+CELL_KEY_BITS = 20
+
+
+class TemplateIndex:
+    """A spatial index mapping canvas coordinates to the templates covering them.
+
+    The canvas is split in a grid of square cells, each cell has the list of the
+    templates whose bounding box overlaps it. Finding the templates touched by
+    a batch of pixels only checks the templates of the cells these pixels are in.
+    The index can be updated and queried from different threads."""
+
+    def __init__(self, cell_size: int = CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self._cells: dict[int, list] = {}
+        # bounding box (x0, y0, x1, y1) of each indexed template by id
+        self._boxes: dict[int, tuple[int, int, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, template) -> bool:
+        return id(template) in self._boxes
+
+    def _get_cell_keys(self, box: tuple[int, int, int, int]) -> list[int]:
+        x0, y0, x1, y1 = box
+        # the pixels are never at negative coordinates
+        x0, y0 = max(x0, 0), max(y0, 0)
+        if x1 <= x0 or y1 <= y0:
+            return []
+        cs = self.cell_size
+        return [
+            cell_y << CELL_KEY_BITS | cell_x
+            for cell_y in range(y0 // cs, (y1 - 1) // cs + 1)
+            for cell_x in range(x0 // cs, (x1 - 1) // cs + 1)
+        ]
+
+    def add(self, template) -> None:
+        """Add a template to the index (or move it if its coordinates changed)."""
+        box = (
+            template.ox,
+            template.oy,
+            template.ox + template.width,
+            template.oy + template.height,
+        )
+        with self._lock:
+            self._remove(template)
+            self._boxes[id(template)] = box
+            for key in self._get_cell_keys(box):
+                self._cells.setdefault(key, []).append(template)
+
+    def remove(self, template) -> None:
+        """Remove a template from the index (nothing happens if it isn't in it)."""
+        with self._lock:
+            self._remove(template)
+
+    def _remove(self, template) -> None:
+        box = self._boxes.pop(id(template), None)
+        if box is None:
+            return
+        for key in self._get_cell_keys(box):
+            cell = self._cells[key]
+            cell[:] = [t for t in cell if t is not template]
+            if not cell:
+                del self._cells[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cells.clear()
+            self._boxes.clear()
+
+    def get_templates_at(self, x: int, y: int) -> list:
+        """Get the templates with a bounding box covering the coordinates."""
+        if x < 0 or y < 0:
+            return []
+        key = (y // self.cell_size) << CELL_KEY_BITS | (x // self.cell_size)
+        with self._lock:
+            return [
+                template
+                for template in self._cells.get(key, [])
+                if _in_box(self._boxes[id(template)], x, y)
+            ]
+
+    def get_changed_templates(self, xs: np.ndarray, ys: np.ndarray) -> dict:
+        """Find the templates covering a batch of pixels.
+
+        Return a dictionary with the templates as keys and the positions in
+        `xs`/`ys` of the pixels inside their bounding box as values."""
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        if xs.size == 0:
+            return {}
+        keys = (ys // self.cell_size) << CELL_KEY_BITS | (xs // self.cell_size)
+        # group the pixels by cell
+        order = np.argsort(keys, kind="stable")
+        cell_keys, starts = np.unique(keys[order], return_index=True)
+        ends = np.append(starts[1:], order.size)
+
+        positions = {}
+        templates = {}
+        with self._lock:
+            for key, start, end in zip(cell_keys.tolist(), starts, ends):
+                cell = self._cells.get(key)
+                if not cell:
+                    continue
+                cell_positions = order[start:end]
+                cell_xs = xs[cell_positions]
+                cell_ys = ys[cell_positions]
+                for template in cell:
+                    x0, y0, x1, y1 = self._boxes[id(template)]
+                    inside = (cell_xs >= x0) & (cell_xs < x1)
+                    inside &= (cell_ys >= y0) & (cell_ys < y1)
+                    if np.any(inside):
+                        templates[id(template)] = template
+                        positions.setdefault(id(template), []).append(
+                            cell_positions[inside]
+                        )
+        return {
+            templates[template_id]: np.sort(np.concatenate(template_positions))
+            for template_id, template_positions in positions.items()
+        }
+
+
+def _in_box(box: tuple[int, int, int, int], x: int, y: int) -> bool:
+    x0, y0, x1, y1 = box
+    return x0 <= x < x1 and y0 <= y < y1
@@ -5,8 +5,10 @@ import copy
 import os
 import re
 import sqlite3
+import threading
 import time
 import urllib.parse
+from collections import Counter
 from datetime import datetime, timedelta
 from io import BytesIO
 from typing import Iterable, Optional
@@ -22,14 +24,30 @@ from utils.font.font_manager import PixelText
 from utils.image.gif_saver import save_transparent_gif
 from utils.image.image_utils import highlight_image
 from utils.log import get_logger
+from utils.pxls.board_buffer import BoardBuffer
+from utils.pxls.combo_canvas import ComboCanvas
+from utils.pxls.grief_detector import GriefDetector
+from utils.pxls.palettizer import highlight_palettized_image
 from utils.pxls.template import get_rgba_palette, reduce
-from utils.setup import db_templates, stats
+from utils.pxls.template_index import TemplateIndex
+from utils.pxls.template_progress import ProgressBatch
+from utils.setup import db_templates, stats, template_cache
 from utils.time_converter import round_minutes_down, td_format
 from utils.utils import get_content, in_executor
 
 logger = get_logger("template_manager")
 tracker_logger = get_logger("template_tracker", file="templates.log", in_console=False)
 
+# maximum number of templates loaded at the same time (in total and per image host)
+MAX_CONCURRENT_LOADS = int(os.environ.get("TEMPLATE_LOAD_CONCURRENCY", 8))
+MAX_LOADS_PER_HOST = int(os.environ.get("TEMPLATE_LOAD_PER_HOST", 2))
+# timeout (in seconds) to download and parse a template
+TEMPLATE_LOAD_TIMEOUT = 5.0
+
+# held while the progress of a template is computed or updated from the board changes
+# (the changes are applied from the websocket thread)
+progress_lock = threading.RLock()
+
 
 class Template:
     def __init__(
@@ -41,7 +59,10 @@ class Template:
         ox: int,
         oy: int,
         canvas_code,
+        palettized_array: np.ndarray = None,
     ) -> None:
+        """`image_array` is the RGBA template image, it can be None if
+        the `palettized_array` (array of palette indexes) is given."""
         # template metadata
         self.url = url
         self.stylized_url = stylized_url
@@ -56,9 +77,9 @@ class Template:
         self.id = None
 
         # template image and array
-        self.palettized_array: np.ndarray = reduce(
-            image_array, get_rgba_palette()
-        )  # array of palette indexes
+        if palettized_array is None:
+            palettized_array = reduce(image_array, get_rgba_palette())
+        self.palettized_array: np.ndarray = palettized_array  # array of palette indexes
 
         # template size and dimensions
         self.width = self.palettized_array.shape[1]
@@ -70,6 +91,13 @@ class Template:
         # progress (init with self.update_progress())
         self.placed_mask = None
         self.current_progress = None
+        # board version of the progress (None if computed on another board)
+        self.progress_version = None
+        # board version of the last change missed by the progress
+        # (set by the TemplateManager)
+        self.changed_version = 0
+        # cached placeable pixels in canvas coordinates (see get_canvas_pixels())
+        self._canvas_pixels = None
 
     def get_array(self) -> np.ndarray:
         """Return the template image as an array of RGB colors"""
@@ -78,7 +106,7 @@ class Template:
     def make_placeable_mask(self) -> np.ndarray:
         """Make a mask of the template shape where the placeable pixels are True."""
         # get the placemap cropped to the template size
-        cropped_placemap = self.crop_array_to_template(stats.placemap_array)
+        cropped_placemap = self.crop_buffer_to_template(stats.placemap_buffer)
         # create a mask with all the non-transparent pixels on the template image (True = non-transparent)
         placeable_mask = self.palettized_array != 255
         # exclude pixels outside of the placemap
@@ -89,8 +117,9 @@ class Template:
         """Make a mask of the template shape where the correct pixels are True."""
         # get the current board cropped to the template size
         if board_array is None:
-            board_array = stats.board_array
-        cropped_board = self.crop_array_to_template(board_array)
+            cropped_board = self.crop_buffer_to_template(stats.board_buffer)
+        else:
+            cropped_board = self.crop_array_to_template(board_array)
         # create a mask with the pixels of the template matching the board
         placed_mask = self.palettized_array == cropped_board
         # exclude the pixels outside of the placemap
@@ -99,10 +128,77 @@ class Template:
 
     def update_progress(self, board_array=None) -> int:
         """Update the mask with the correct pixels and the number of correct pixels."""
-        self.placed_mask = self.make_placed_mask(board_array)
-        self.current_progress = int(np.sum(self.placed_mask))
+        with progress_lock:
+            if board_array is None:
+                version, board_array = stats.get_board_snapshot()
+            else:
+                version = None
+            self.placed_mask = self.make_placed_mask(board_array)
+            self.current_progress = int(np.sum(self.placed_mask))
+            self.progress_version = version
+            return self.current_progress
+
+    def apply_board_changes(self, xs, ys, new_values, version: int) -> np.ndarray:
+        """Update the progress with pixels that changed on the board inside the template
+        bounds (the progress must be up to date with the board before the changes).
+        Return the mask of the pixels that went from correct to wrong (griefed)."""
+        xs = xs - self.ox
+        ys = ys - self.oy
+        placeable = self.placeable_mask[ys, xs]
+        expected = self.palettized_array[ys[placeable], xs[placeable]]
+        # the previous state is read from the mask so the progress count
+        # always stays consistent with it
+        was_correct = self.placed_mask[ys, xs]
+        is_correct = np.zeros_like(placeable)
+        is_correct[placeable] = new_values[placeable] == expected
+        self.placed_mask[ys[placeable], xs[placeable]] = is_correct[placeable]
+        self.current_progress += int(np.sum(is_correct)) - int(np.sum(was_correct))
+        self.progress_version = version
+        return was_correct & ~is_correct
+
+    def get_canvas_pixels(self, canvas_shape) -> tuple[np.ndarray, np.ndarray]:
+        """Get the flat canvas indexes and the palette indexes of the placeable pixels
+        (in the order of `self.placeable_mask[self.placeable_mask]`).
+        The result is cached until the placeable mask or the canvas shape change."""
+        cache = self._canvas_pixels
+        if (
+            cache is None
+            or cache[0] != canvas_shape
+            or cache[1] is not self.placeable_mask
+        ):
+            ys, xs = np.nonzero(self.placeable_mask)
+            flat_indexes = (ys + self.oy) * canvas_shape[1] + (xs + self.ox)
+            colors = self.palettized_array[self.placeable_mask]
+            cache = (canvas_shape, self.placeable_mask, flat_indexes, colors)
+            self._canvas_pixels = cache
+        return cache[2], cache[3]
+
+    def set_progress(self, placed_pixels: np.ndarray, progress: int, version=None) -> int:
+        """Set the progress from the correct state of the placeable pixels
+        (in the order of `get_canvas_pixels()`) computed on the board `version`."""
+        placed_mask = np.zeros_like(self.placeable_mask)
+        placed_mask[self.placeable_mask] = placed_pixels
+        self.placed_mask = placed_mask
+        self.current_progress = int(progress)
+        self.progress_version = version
         return self.current_progress
 
+    def get_recent_changes_mask(self, minutes: float) -> np.ndarray:
+        """Get a mask of the placeable pixels changed in the last `minutes` minutes."""
+        since = int(time.time() - minutes * 60)
+        return stats.last_change.changed_since(
+            since, self.ox, self.oy, self.width, self.height, self.placeable_mask
+        )
+
+    def get_last_change(self) -> Optional[datetime]:
+        """Get the last time a placeable pixel of the template changed (as a naive
+        UTC datetime) or None if no change was seen since the bot started."""
+        change_times = stats.last_change.crop(self.ox, self.oy, self.width, self.height)
+        change_times = change_times[self.placeable_mask]
+        if change_times.size == 0 or change_times.max() == 0:
+            return None
+        return datetime.utcfromtimestamp(int(change_times.max()))
+
     def crop_array_to_template(self, array: np.ndarray) -> np.ndarray:
         """Crop an array to fit in the template bounds
         (used to crop the board and placemap to the template size for previews and such)
@@ -122,6 +218,11 @@ class Template:
 
         return cropped_array
 
+    def crop_buffer_to_template(self, buffer: BoardBuffer) -> np.ndarray:
+        """Crop a board buffer to the template bounds like `crop_array_to_template()`,
+        copying only the template area from the buffer"""
+        return buffer.crop(self.ox, self.oy, self.width, self.height)
+
     def get_progress_image(self, opacity=0.65, board_array=None) -> Image.Image:
         """
         Get an image with the canvas progress colored as such:
@@ -148,8 +249,9 @@ class Template:
         # layer the board under the progress image if the progress opacity is less than 1
         if opacity < 1:
             if board_array is None:
-                board_array = stats.board_array
-            cropped_board = self.crop_array_to_template(board_array)
+                cropped_board = self.crop_buffer_to_template(stats.board_buffer)
+            else:
+                cropped_board = self.crop_array_to_template(board_array)
             # remove the pixels outside of the template visible pixels area
             cropped_board[self.palettized_array == 255] = 255
             board_image = Image.fromarray(stats.palettize_array(cropped_board))
@@ -162,21 +264,33 @@ class Template:
         return res_image
 
     async def get_preview_image(
-        self, array=None, crop_to_template=True, opacity=0.2
+        self, array=None, crop_to_template=True, opacity=0.2, palette=None
     ) -> Image.Image:
         """Get an image of the template (or the given array) over the canvas.
 
         Parameters
         ----------
-        array: the array to highlight over the canvas (default: template array)
+        array: the array to highlight over the canvas, as palette indexes or RGBA
+        colors (default: template array)
         crop_to_template: crop the background to the template placemap
-        opacity: the opacity of the canvas."""
+        opacity: the opacity of the canvas
+        palette: the palette of the array if it is palette indexes
+        (default: pxls palette)"""
         if array is None:
-            array = self.get_array()
+            array = self.palettized_array
         board = await stats.get_placable_board()
         cropped_board = self.crop_array_to_template(board)
         if crop_to_template:
             cropped_board[~self.placeable_mask] = 255
+        if array.ndim == 2:
+            # palette indexes: keep the image in palette mode if the colors fit
+            pxls_palette = stats.get_hex_palette()
+            image = highlight_palettized_image(
+                array, cropped_board, palette or pxls_palette, pxls_palette, opacity
+            )
+            if image is not None:
+                return image
+            array = stats.palettize_array(array, palette)
         cropped_board_array = stats.palettize_array(cropped_board)
         return highlight_image(array, cropped_board_array, opacity, (0, 0, 0, 255))
 
@@ -195,7 +309,7 @@ class Template:
 
     def get_virgin_abuse(self):
         """Return the number of correct pixels that are also virgin pixels"""
-        template_virginmap = self.crop_array_to_template(stats.virginmap_array)
+        template_virginmap = self.crop_buffer_to_template(stats.virginmap_buffer)
         abuse_mask = np.logical_and(template_virginmap, self.placed_mask)
         return int(np.sum(abuse_mask))
 
@@ -402,6 +516,13 @@ class Combo(Template):
         # progress (init with self.update_progress())
         self.placed_mask = None
         self.current_progress = None
+        # board version of the progress (None if computed on another board)
+        self.progress_version = None
+        # board version of the last change missed by the progress
+        # (set by the TemplateManager)
+        self.changed_version = 0
+        # cached placeable pixels in canvas coordinates (see get_canvas_pixels())
+        self._canvas_pixels = None
 
 
 class TemplateManager:
@@ -412,6 +533,123 @@ class TemplateManager:
         self.progress_admins = []
         self.combo: Combo = None
         self.is_loading = False
+        # the templates of self.list by canvas coordinates
+        self.index = TemplateIndex()
+        stats.add_board_listener(self.on_board_changes)
+        # the templates of self.list layered on the canvas, used for the @combo
+        self.combo_canvas = ComboCanvas()
+        # the pixels griefed on the templates of self.list
+        self.grief_detector = GriefDetector()
+        # task checking the templates loaded from the cache
+        self._revalidation_task: asyncio.Task = None
+        # downloads and parses the templates concurrently
+        self.loader = TemplateLoader()
+
+    def add_template(self, template: Template, position: int = None):
+        """Add a template in the list (at the end by default) and in the index."""
+        if position is None:
+            self.list.append(template)
+        else:
+            self.list.insert(position, template)
+        self.index.add(template)
+        # the pixels changed before the template was indexed weren't seen
+        template.changed_version = stats.board_buffer.version
+
+    def remove_template(self, template: Template):
+        """Remove a template from the list, the index and the grief detector."""
+        self.list.remove(template)
+        self.index.remove(template)
+        self.grief_detector.forget(template)
+
+    def replace_template(self, old_template: Template, new_template: Template):
+        """Replace a template with a new version of it (with the same ID) at the
+        same position in the list, keeping its grief history."""
+        position = self.list.index(old_template)
+        self.list.remove(old_template)
+        self.index.remove(old_template)
+        self.add_template(new_template, position)
+
+    def on_board_changes(self, changes):
+        """Update the progress of the templates touched by the board changes and
+        record their griefed pixels, or mark them as outdated if their progress
+        wasn't computed yet (called from the websocket thread).
+
+        `changes` is None when the whole board was replaced: the changes since the
+        last board aren't known so the progress of all the templates is outdated."""
+        if changes is None:
+            with progress_lock:
+                for template in list(self.list):
+                    template.progress_version = None
+            return
+        if changes.flat_indexes.size == 0:
+            return
+        now = int(time.time())
+        xs, ys = changes.xs, changes.ys
+        changed_templates = self.index.get_changed_templates(xs, ys)
+        with progress_lock:
+            for template, positions in changed_templates.items():
+                if (
+                    template.progress_version is not None
+                    and changes.version <= template.progress_version
+                ):
+                    # the progress was computed on a board snapshot taken after
+                    # these changes (the board reloads never get here)
+                    continue
+                if self.is_progress_outdated(template):
+                    template.changed_version = max(
+                        template.changed_version, changes.version
+                    )
+                    continue
+                griefed = template.apply_board_changes(
+                    xs[positions],
+                    ys[positions],
+                    changes.new_values[positions],
+                    changes.version,
+                )
+                griefed_positions = positions[griefed]
+                self.grief_detector.record(
+                    template,
+                    now,
+                    xs[griefed_positions],
+                    ys[griefed_positions],
+                    changes.new_values[griefed_positions],
+                )
+
+    def is_progress_outdated(self, template: Template) -> bool:
+        """Check if the progress of a tracked template must be computed again
+        (it wasn't computed on the current board or it missed board changes)."""
+        return (
+            template.progress_version is None
+            or template.progress_version < template.changed_version
+        )
+
+    def update_progress(self, template: Template) -> int:
+        """Update the progress of a tracked template, only if its progress isn't kept
+        up to date with the board changes."""
+        with progress_lock:
+            if self.is_progress_outdated(template):
+                return template.update_progress()
+            return template.current_progress
+
+    def update_all_progress(self, templates: list[Template]) -> list[int]:
+        """Update the progress of several tracked templates in a single pass on the board
+        (only the templates with an outdated progress are computed, the others are
+        kept up to date with the board changes).
+
+        Return the progress of each template."""
+        with progress_lock:
+            version, board_array = stats.get_board_snapshot()
+            outdated = [t for t in templates if self.is_progress_outdated(t)]
+            if outdated and board_array is not None:
+                batch = ProgressBatch(
+                    [t.get_canvas_pixels(board_array.shape) for t in outdated]
+                )
+                counts, correct = batch.compute(board_array)
+                for i, template in enumerate(outdated):
+                    template.set_progress(
+                        batch.get_segment(correct, i), counts[i], version
+                    )
+            return [t.current_progress for t in templates]
 
     def load_progress_admins(self, bot_owner_id: int):
         """Update the current `progress_admins` list with the PROGRESS_ADMINS env variable
@@ -508,7 +746,7 @@ class TemplateManager:
         id = await db_templates.create_template(template)
         template.id = id
         # save in list
-        self.list.append(template)
+        self.add_template(template)
         # update the @combo
         self.update_combo()
         # log
@@ -543,7 +781,7 @@ class TemplateManager:
             raise ValueError("You cannot delete the combo.")
 
         await db_templates.delete_template(temp)
-        self.list.remove(temp)
+        self.remove_template(temp)
         self.update_combo()
         tracker_logger.info(
             f"Template deleted: '{temp.name}' by {command_user} ({command_user.id})"
@@ -566,7 +804,7 @@ class TemplateManager:
             raise ValueError("You cannot edit the combo.")
 
         if new_url:
-            new_temp = await get_template_from_url(new_url)
+            new_temp = await self.loader.load(new_url)
             # check on template link size
             if new_temp.stylized_url.startswith("data:image"):
                 msg = "You cannot add a template with a base64 URL to the tracker."
@@ -623,9 +861,7 @@ class TemplateManager:
             )
         if not temp_id:
             raise ValueError("There was an error while updating the template.")
-        old_temp_index = self.list.index(old_temp)
-        self.list.remove(old_temp)
-        self.list.insert(old_temp_index, new_temp)
+        self.replace_template(old_temp, new_temp)
         self.update_combo()
         tracker_logger.info(
             "Template updated: '{}' by {} ({}):{}{}{}".format(
@@ -656,48 +892,62 @@ class TemplateManager:
         db_list = await db_templates.get_all_templates(canvas_code)
         initial_len = len(self.list)
         has_combo = False
+        cached_templates = []
+        loaded_templates = []  # (database row, template)
+        to_download = []  # database rows
         if stats.placemap_array is not None:
             for db_temp in db_list:
                 name = db_temp["name"]
-                owner_id = db_temp["owner_id"]
-                hidden = db_temp["hidden"]
-                url = db_temp["url"]
-                id = db_temp["id"]
-                if name != "@combo":
-                    if self.get_template(name, owner_id, hidden):
-                        if not update:
-                            logger.debug(
-                                f"Template {name} not loaded: Duplicate template."
-                            )
-                        continue
-                    try:
-                        temp = await asyncio.wait_for(
-                            get_template_from_url(url), timeout=5.0
-                        )
-                        temp.name = name
-                        temp.owner_id = int(owner_id)
-                        temp.hidden = bool(hidden)
-                        temp.canvas_code = canvas_code
-                        temp.id = id
-                        self.list.append(temp)
-                        logger.debug(
-                            f"template {temp.name} loaded ({len(self.list)}/{len(db_list)-1})"
-                        )
-                    except asyncio.TimeoutError:
-                        if not update:
-                            logger.warn(
-                                "Failed to load template {}: TimeoutError".format(name)
-                            )
-                    except Exception as e:
-                        if not update:
-                            logger.warn("Failed to load template {}: {}".format(name, e))
-                else:
+                if name == "@combo":
                     has_combo = True
+                    continue
+                if self.get_template(name, db_temp["owner_id"], db_temp["hidden"]):
+                    if not update:
+                        logger.debug(f"Template {name} not loaded: Duplicate template.")
+                    continue
+                # load the template from the cache and check it later
+                try:
+                    temp = await get_cached_template(db_temp["url"])
+                except Exception as e:
+                    logger.debug(f"Couldn't load template {name} from the cache: {e}")
+                    temp = None
+                if temp is not None:
+                    cached_templates.append(temp)
+                    loaded_templates.append((db_temp, temp))
+                else:
+                    to_download.append(db_temp)
+
+            # download and parse the other templates concurrently
+            results = await self.loader.load_all([t["url"] for t in to_download])
+            for db_temp, (temp, timings) in zip(to_download, results):
+                name = db_temp["name"]
+                if isinstance(temp, Exception):
+                    if not update:
+                        logger.warn(f"Failed to load template {name}: {temp!r}")
+                    continue
+                logger.debug(f"Template {name} loaded ({format_timings(timings)})")
+                loaded_templates.append((db_temp, temp))
+
+            for db_temp, temp in loaded_templates:
+                name = db_temp["name"]
+                if self.get_template(name, db_temp["owner_id"], db_temp["hidden"]):
+                    continue
+                temp.name = name
+                temp.owner_id = int(db_temp["owner_id"])
+                temp.hidden = bool(db_temp["hidden"])
+                temp.canvas_code = canvas_code
+                temp.id = db_temp["id"]
+                self.add_template(temp)
         end = time.time()
         nb_templates = len(db_list) - (1 if has_combo else 0)
         if not update or (update and len(self.list) != initial_len):
             logger.info(
-                f"{len(self.list)}/{nb_templates} Templates loaded (time: {round(end-start, 2)}s)"
+                "{}/{} Templates loaded ({} from the cache, time: {}s)".format(
+                    len(self.list),
+                    nb_templates,
+                    len(cached_templates),
+                    round(end - start, 2),
+                )
             )
         elif update and len(self.list) != nb_templates:
             logger.debug("Couldn't load all templates.")
@@ -706,10 +956,88 @@ class TemplateManager:
         self.list.sort(key=lambda x: x.id)
         self.is_loading = False
 
+        # check that the images of the templates loaded from the cache didn't change
+        if cached_templates and (
+            self._revalidation_task is None or self._revalidation_task.done()
+        ):
+            self._revalidation_task = asyncio.create_task(
+                self.revalidate_templates(cached_templates, canvas_code)
+            )
+        elif stats.placemap_array is not None:
+            # (otherwise the revalidation prunes the cache when it's done)
+            await self.prune_template_cache(canvas_code)
+
+    async def prune_template_cache(self, canvas_code):
+        """Remove the template arrays and images from the cache that aren't used by
+        the templates in the database, in self.list or being loaded.
+
+        Nothing is removed while the templates are loading or being revalidated,
+        their images may not be in self.list yet."""
+        if self.is_loading or (
+            self._revalidation_task is not None
+            and not self._revalidation_task.done()
+            and self._revalidation_task is not asyncio.current_task()
+        ):
+            return
+        try:
+            db_list = await db_templates.get_all_templates(canvas_code)
+        except Exception:
+            logger.exception("Couldn't prune the template cache:")
+            return
+        template_urls = {t["url"] for t in db_list}
+        template_urls.update(temp.url for temp in self.list)
+        template_urls.update(self.loader.loading)
+        palette = stats.get_hex_palette()
+        templates = []
+        for template_url in template_urls:
+            params = parse_template(template_url)
+            if params is None or not params["tw"].isdigit():
+                continue
+            templates.append((params["template"], int(params["tw"]), palette))
+        try:
+            nb_removed = await in_executor()(template_cache.prune)(templates)
+        except Exception:
+            logger.exception("Couldn't prune the template cache:")
+            return
+        if nb_removed:
+            logger.debug(f"{nb_removed} unused templates removed from the cache.")
+
+    async def revalidate_templates(self, templates: list[Template], canvas_code):
+        """Download the templates again and replace the ones with a different image
+        (used for the templates loaded from the cache), then prune the cache."""
+        results = await self.loader.load_all([temp.url for temp in templates])
+        nb_changed = 0
+        for temp, (new_temp, _) in zip(templates, results):
+            if isinstance(new_temp, Exception):
+                logger.debug(f"Couldn't revalidate template {temp.name}: {new_temp!r}")
+                continue
+            if (
+                new_temp.palettized_array.shape == temp.palettized_array.shape
+                and (new_temp.palettized_array == temp.palettized_array).all()
+            ):
+                continue
+            # the image changed since it was cached
+            if temp not in self.list:
+                continue
+            new_temp.name = temp.name
+            new_temp.owner_id = temp.owner_id
+            new_temp.hidden = temp.hidden
+            new_temp.canvas_code = temp.canvas_code
+            new_temp.id = temp.id
+            self.replace_template(temp, new_temp)
+            nb_changed += 1
+        if nb_changed:
+            logger.info(f"{nb_changed} cached templates were reloaded with a new image.")
+            if self.combo is not None:
+                self.update_combo()
+        await self.prune_template_cache(canvas_code)
+
     def make_combo_image(self) -> np.ndarray:
-        """Make an index array combining all the template arrays in self.list"""
-        # reverse order to put the new templates at the bottom
-        return layer(self.list[::-1], crop_to_template=False)[2]
+        """Make an index array combining all the template arrays in self.list
+        (only the templates added or removed since the last call are layered again)"""
+        placemap = stats.placemap_array
+        self.combo_canvas.sync(self.list, placemap.shape)
+        return self.combo_canvas.get_array(placemap)
 
     def update_combo(self, bot_id=None, canvas_code=None) -> Combo:
         """Update the combo template or create it if it doesn't exist"""
@@ -761,7 +1089,7 @@ class TemplateManager:
         return templates
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, cache=True, nogil=True)
 def fast_detemplatize(array, true_height, true_width, block_size):
 
     result = np.zeros((true_height, true_width, 4), dtype=np.uint8)
@@ -813,8 +1141,13 @@ def parse_template(template_url: str):
     return params
 
 
-async def get_template_from_url(template_url: str) -> Template:
-    """Make a Template object from a template URL"""
+async def get_template_from_url(template_url: str, timings: dict = None) -> Template:
+    """Make a Template object from a template URL
+
+    If a `timings` dictionary is given, the time spent downloading and parsing
+    the template image are saved in it (in seconds)."""
+    if timings is None:
+        timings = {}
     params = parse_template(template_url)
 
     if params is None:
@@ -823,23 +1156,37 @@ async def get_template_from_url(template_url: str) -> Template:
     image_url = params["template"]
     true_width = int(params["tw"])
 
+    download_start = time.perf_counter()
     try:
         image_bytes = await get_content(image_url, "image")
     except Exception:
         raise ValueError("Couldn't download the template image.")
+    timings["download"] = time.perf_counter() - download_start
     canvas_code = await stats.get_canvas_code()
+    palette = stats.get_hex_palette()
 
     @in_executor()
     def _get_template():
-        template_image = Image.open(BytesIO(image_bytes))
-        if template_image.mode != "RGBA":
-            template_image = template_image.convert("RGBA")
-        template_array = np.array(template_image)
-
-        detemp_array = detemplatize(template_array, true_width)
+        parse_start = time.perf_counter()
+        try:
+            return _parse_template()
+        finally:
+            timings["parse"] = time.perf_counter() - parse_start
+
+    def _parse_template():
+        # use the array parsed before from the same image if there is one
+        palettized_array = template_cache.get(image_url, true_width, palette, image_bytes)
+        if palettized_array is not None:
+            detemp_array = None
+        else:
+            template_image = Image.open(BytesIO(image_bytes))
+            if template_image.mode != "RGBA":
+                template_image = template_image.convert("RGBA")
+            template_array = np.array(template_image)
+            detemp_array = detemplatize(template_array, true_width)
         ox = int(params["ox"])
         oy = int(params["oy"])
-        return Template(
+        template = Template(
             template_url,
             image_url,
             params.get("title"),
@@ -847,13 +1194,143 @@ async def get_template_from_url(template_url: str) -> Template:
             ox,
             oy,
             canvas_code,
+            palettized_array,
         )
+        if palettized_array is None:
+            try:
+                template_cache.put(
+                    image_url, image_bytes, true_width, palette, template.palettized_array
+                )
+            except OSError as e:
+                logger.warning(f"Couldn't save the template in the cache: {e}")
+        return template
 
     # run this part of the code in executor to make it not blocking
     template = await _get_template()
     return template
 
 
+async def get_cached_template(template_url: str) -> Optional[Template]:
+    """Make a Template object from a template URL with the image array saved
+    in the template cache the last time it was downloaded, without downloading it.
+    Return None if the template isn't in the cache."""
+    params = parse_template(template_url)
+    if params is None:
+        return None
+    image_url = params["template"]
+    true_width = int(params["tw"])
+    canvas_code = await stats.get_canvas_code()
+    palette = stats.get_hex_palette()
+
+    @in_executor()
+    def _get_template():
+        palettized_array = template_cache.get(image_url, true_width, palette)
+        if palettized_array is None:
+            return None
+        return Template(
+            template_url,
+            image_url,
+            params.get("title"),
+            None,
+            int(params["ox"]),
+            int(params["oy"]),
+            canvas_code,
+            palettized_array,
+        )
+
+    return await _get_template()
+
+
+class TemplateLoader:
+    """Download and parse templates concurrently.
+
+    At most `max_concurrency` templates are loaded at the same time, with at most
+    `max_per_host` images downloaded from the same host. The images are parsed in
+    the threads of the default executor."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENT_LOADS,
+        max_per_host: int = MAX_LOADS_PER_HOST,
+        timeout: float = TEMPLATE_LOAD_TIMEOUT,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        # the limits are shared by all the batches loading at the same time
+        # (the semaphores are made in the bot loop, on the first load)
+        self._semaphore: asyncio.Semaphore = None
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+        # URLs of the templates being loaded (kept by the template cache pruning)
+        self.loading: Counter[str] = Counter()
+
+    def _get_semaphores(self, host: str) -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        """Get the semaphores limiting the loads from a host and all the loads."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_semaphores[host], self._semaphore
+
+    async def load(self, template_url: str, timings: dict = None) -> Template:
+        """Load the template of a URL within the limits of the loader.
+
+        Raises ValueError if the template cannot be loaded."""
+        if timings is None:
+            timings = {}
+        start = time.perf_counter()
+        params = parse_template(template_url)
+        host = urlparse(params["template"]).netloc if params else None
+        host_semaphore, semaphore = self._get_semaphores(host)
+        self.loading[template_url] += 1
+        try:
+            async with host_semaphore, semaphore:
+                timings["wait"] = time.perf_counter() - start
+                return await asyncio.wait_for(
+                    get_template_from_url(template_url, timings), self.timeout
+                )
+        except asyncio.TimeoutError:
+            raise ValueError("The template took too long to load.")
+        finally:
+            self.loading[template_url] -= 1
+            if self.loading[template_url] == 0:
+                del self.loading[template_url]
+
+    async def load_all(self, template_urls: list[str]) -> list[tuple]:
+        """Load the templates of a list of URLs.
+
+        Return a list with the (template, timings) of each URL, the template is
+        replaced with the exception raised if it couldn't be loaded. The timings are
+        the times spent waiting, downloading, parsing and in total (in seconds)."""
+
+        async def load(template_url):
+            timings = {}
+            start = time.perf_counter()
+            try:
+                template = await self.load(template_url, timings)
+            except Exception as e:
+                template = e
+            timings["total"] = time.perf_counter() - start
+            return template, timings
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[load(url) for url in template_urls])
+        if results:
+            slowest = max(timings["total"] for _, timings in results)
+            logger.debug(
+                "{} templates loaded in {}s (slowest: {}s)".format(
+                    len(results),
+                    round(time.perf_counter() - start, 2),
+                    round(slowest, 2),
+                )
+            )
+        return results
+
+
+def format_timings(timings: dict) -> str:
+    return ", ".join(f"{name}: {round(t, 2)}s" for name, t in timings.items())
+
+
 def crop_array_to_shape(array1, height, width, oy, ox):
     y0 = min(max(0, oy), array1.shape[0])
     y1 = max(0, min(array1.shape[0], oy + height))
@@ -908,9 +1385,7 @@ def make_before_after_gif(
     max_width = max_x1 - min_x0
 
     # crop the current canvas to the result images size
-    background_before = crop_array_to_shape(
-        stats.board_array, max_height, max_width, min_y0, min_x0
-    )
+    background_before = stats.board_buffer.crop(min_x0, min_y0, max_width, max_height)
     background_before = stats.palettize_array(background_before)
     background_after = background_before.copy()
 
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class ProgressBatch:
+    """The placeable pixels of several templates gathered in a single array of
+    flat canvas indexes, to compute the progress of all the templates in one pass
+    on the board.
+
+    `pixels` is a list with the (flat canvas indexes, palette indexes) of the
+    placeable pixels of each template."""
+
+    def __init__(self, pixels: list[tuple[np.ndarray, np.ndarray]]) -> None:
+        sizes = [len(flat_indexes) for flat_indexes, _ in pixels]
+        # the pixels of the template i are in [offsets[i]:offsets[i+1]]
+        self.offsets = np.zeros(len(pixels) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+        if pixels:
+            self.flat_indexes = np.concatenate([p[0] for p in pixels])
+            self.colors = np.concatenate([p[1] for p in pixels])
+        else:
+            self.flat_indexes = np.empty(0, dtype=np.intp)
+            self.colors = np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def compute(self, board_array: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Compare all the pixels with the board.
+
+        Return the number of correct pixels of each template and a boolean array
+        with the correct pixels of all the templates (see `get_segment()`)."""
+        correct = board_array.reshape(-1)[self.flat_indexes] == self.colors
+        # sum the correct pixels of each template with a cumulative sum
+        # (np.add.reduceat doesn't handle the templates without pixels)
+        cumulative = np.zeros(correct.size + 1, dtype=np.int64)
+        np.cumsum(correct, out=cumulative[1:])
+        counts = cumulative[self.offsets[1:]] - cumulative[self.offsets[:-1]]
+        return counts, correct
+
+    def get_segment(self, array: np.ndarray, i: int) -> np.ndarray:
+        """Get the values of the template i in an array aligned with the pixels."""
+        return array[self.offsets[i] : self.offsets[i + 1]]
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+from utils.pxls.board_buffer import BoardBuffer, BoardChanges
+
+TILE_SIZE = 256
+# number of downscaled levels (level n is the board downscaled by 2^n)
+MAX_LEVEL = 4
+
+
+class TilePyramid:
+    """A cache of downscaled versions of a board, split in tiles of palette indexes.
+
+    Level 0 is the board itself, level n is the board downscaled by 2^n
+    (nearest neighbor, so the tiles stay palette indexes). The tiles of the
+    downscaled levels are only computed when needed and are invalidated
+    individually when the board changes, so a thumbnail only recomputes the
+    tiles where pixels were placed since the last render."""
+
+    def __init__(self, board: BoardBuffer, max_level: int = MAX_LEVEL) -> None:
+        self.board = board
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        self._shape = None
+        self._load_version = None
+        # per level: tiles, board version at which each tile was computed and
+        # board version of the last change in each tile
+        self._tiles: dict[int, dict[tuple[int, int], np.ndarray]] = {}
+        self._computed_versions: dict[int, np.ndarray] = {}
+        self._changed_versions: dict[int, np.ndarray] = {}
+
+    def _level_shape(self, level: int) -> tuple[int, int]:
+        scale = 1 << level
+        height, width = self._shape
+        return -(-height // scale), -(-width // scale)
+
+    def _reset(self, shape: tuple[int, int], version: int) -> None:
+        self._shape = shape
+        self._tiles = {}
+        self._computed_versions = {}
+        self._changed_versions = {}
+        for level in range(1, self.max_level + 1):
+            height, width = self._level_shape(level)
+            tiles_shape = (-(-height // TILE_SIZE), -(-width // TILE_SIZE))
+            self._tiles[level] = {}
+            self._computed_versions[level] = np.full(tiles_shape, -1, dtype=np.int64)
+            self._changed_versions[level] = np.full(tiles_shape, version, dtype=np.int64)
+
+    def invalidate(self, changes: BoardChanges) -> None:
+        """Mark the tiles containing the changed pixels as outdated."""
+        with self._lock:
+            if self._shape != changes.shape or changes.flat_indexes.size == 0:
+                return
+            xs = changes.xs
+            ys = changes.ys
+            for level in range(1, self.max_level + 1):
+                tile_ys = (ys >> level) // TILE_SIZE
+                tile_xs = (xs >> level) // TILE_SIZE
+                self._changed_versions[level][tile_ys, tile_xs] = changes.version
+
+    def _get_tile(self, level, tile_y, tile_x) -> np.ndarray:
+        if self._computed_versions[level][tile_y, tile_x] >= max(
+            0, self._changed_versions[level][tile_y, tile_x]
+        ):
+            return self._tiles[level][(tile_y, tile_x)]
+        scale = 1 << level
+        y0 = tile_y * TILE_SIZE * scale
+        x0 = tile_x * TILE_SIZE * scale
+        y1 = y0 + TILE_SIZE * scale
+        x1 = x0 + TILE_SIZE * scale
+        # only copy the tile area from the board
+        version, tile = self.board.read_region(x0, y0, x1, y1, scale)
+        self._tiles[level][(tile_y, tile_x)] = tile
+        self._computed_versions[level][tile_y, tile_x] = version
+        return tile
+
+    def get_region(self, level: int, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Get the region between (x0, y0) and (x1, y1) (excluded) at a level,
+        the coordinates are in the level coordinates (board coordinates / 2^level)."""
+        if level == 0:
+            # only copy the region from the board
+            return self.board.read_region(max(0, x0), max(0, y0), x1, y1)[1]
+        shape = self.board.shape
+        if shape is None:
+            return None
+        with self._lock:
+            load_version = self.board.load_version
+            if self._shape != shape or self._load_version != load_version:
+                self._load_version = load_version
+                self._reset(shape, load_version)
+            height, width = self._level_shape(level)
+            x0, x1 = max(0, x0), min(width, x1)
+            y0, y1 = max(0, y0), min(height, y1)
+            res = np.empty((max(0, y1 - y0), max(0, x1 - x0)), dtype=np.uint8)
+            for tile_y in range(y0 // TILE_SIZE, -(-y1 // TILE_SIZE)):
+                for tile_x in range(x0 // TILE_SIZE, -(-x1 // TILE_SIZE)):
+                    tile = self._get_tile(level, tile_y, tile_x)
+                    # intersection of the tile with the region
+                    tile_y0 = tile_y * TILE_SIZE
+                    tile_x0 = tile_x * TILE_SIZE
+                    iy0, iy1 = max(y0, tile_y0), min(y1, tile_y0 + tile.shape[0])
+                    ix0, ix1 = max(x0, tile_x0), min(x1, tile_x0 + tile.shape[1])
+                    res[iy0 - y0 : iy1 - y0, ix0 - x0 : ix1 - x0] = tile[
+                        iy0 - tile_y0 : iy1 - tile_y0, ix0 - tile_x0 : ix1 - tile_x0
+                    ]
+        return res
+
+    def get_level(self, level: int) -> np.ndarray:
+        """Get the whole board at a level."""
+        if level == 0:
+            # the whole board: use the shared snapshot
+            return self.board.array
+        shape = self.board.shape
+        if shape is None:
+            return None
+        scale = 1 << level
+        height, width = shape
+        return self.get_region(level, 0, 0, -(-width // scale), -(-height // scale))
+
+    def get_thumbnail(self, max_size: int) -> np.ndarray:
+        """Get the board at the first level where it fits in a `max_size` square."""
+        shape = self.board.shape
+        if shape is None:
+            return None
+        level = 0
+        while level < self.max_level and max(shape) >> level > max_size:
+            level += 1
+        return self.get_level(level)
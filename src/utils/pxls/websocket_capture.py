@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import struct
+import time
+from typing import Iterator
+
+# a frame header: capture time (unix timestamp) and length of the frame
+FRAME_HEADER = struct.Struct("<dI")
+
+
+class CaptureWriter:
+    """Save the raw websocket frames with their reception time in a capture file.
+
+    The file is a sequence of frames: a header (time as a float64 unix timestamp,
+    length as a uint32) followed by the frame bytes."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "ab")
+
+    def write(self, frame, timestamp: float = None) -> None:
+        if isinstance(frame, str):
+            frame = frame.encode()
+        if timestamp is None:
+            timestamp = time.time()
+        self._file.write(FRAME_HEADER.pack(timestamp, len(frame)) + frame)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_capture(path: str) -> Iterator[tuple[float, bytes]]:
+    """Iterate over the (timestamp, frame) of a capture file.
+    A partial frame at the end of the file (interrupted capture) is ignored."""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            timestamp, length = FRAME_HEADER.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            yield timestamp, frame
+
+
+async def replay_capture(path: str, client, speed: float = 1.0) -> int:
+    """Feed the frames of a capture file to a WebsocketClient.
+
+    The frames are sent at their captured pace divided by `speed` (0 = as fast as
+    possible). The pixels batches are applied every `client.batch_interval` seconds
+    of capture time, so the batches are the same whatever the speed.
+    Return the number of frames replayed."""
+    nb_frames = 0
+    first_timestamp = None
+    next_batch = None
+    start = time.monotonic()
+    for timestamp, frame in read_capture(path):
+        if first_timestamp is None:
+            first_timestamp = timestamp
+            next_batch = timestamp + client.batch_interval
+        while timestamp >= next_batch:
+            client.apply_pending_pixels()
+            next_batch += client.batch_interval
+        if speed > 0:
+            delay = (timestamp - first_timestamp) / speed - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        client.handle_message(frame, int(timestamp))
+        nb_frames += 1
+    client.apply_pending_pixels()
+    return nb_frames
@@ -1,41 +1,77 @@
 import asyncio
-import json
 import threading
+import time
 import uuid
+from collections import deque
 
+import numpy as np
 import websockets
 
 from utils.log import get_logger
+from utils.pxls.pixel_journal import PixelJournal
+from utils.pxls.websocket_capture import CaptureWriter
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 logger = get_logger("pxls_websocket")
 
+# time (in seconds) during which the pixels are buffered before being applied
+BATCH_INTERVAL = 0.1
+# time window (in seconds) used to compute the ingest throughput
+THROUGHPUT_WINDOW = 60
+
 
 class WebsocketClient:
     """A threaded websocket client to update the canvas board and online count
-    in real-time."""
+    in real-time.
+
+    The pixels received are buffered and applied on the boards in batches every
+    `batch_interval` seconds. If a `journal` is given, the pixels are also saved
+    in it. If a `capture_path` is given, the raw frames received are saved in this
+    file to be replayed later (see `utils.pxls.websocket_capture`)."""
 
-    def __init__(self, uri: str, stats_manager):
+    def __init__(
+        self,
+        uri: str,
+        stats_manager,
+        batch_interval=BATCH_INTERVAL,
+        journal: PixelJournal = None,
+        capture_path: str = None,
+    ):
         self.uri = uri
         self.stats = stats_manager
+        self.journal = journal
         self.loop = asyncio.new_event_loop()
         self.thread = threading.Thread(target=self._start, daemon=True)
-        self._paused = False
         self.status = False
+        self.batch_interval = batch_interval
+        self.capture_path = capture_path
+        self.capture: CaptureWriter = None
+
+        # pixels received since the last batch was applied
+        self._pending_times = []
+        self._pending_xs = []
+        self._pending_ys = []
+        self._pending_colors = []
+
+        # ingest stats
+        self.pixel_count = 0
+        self._batch_history = deque()  # (time, number of pixels) of the recent batches
 
     def start(self):
         """Start the websocket in a separate thread."""
         self.thread.start()
 
     def _start(self):
-        self.loop.run_until_complete(self._listen())
+        self.loop.run_until_complete(self._run())
 
-    def pause(self):
-        """Pause the websocket."""
-        self._paused = True
-
-    def resume(self):
-        """Resume the websocket."""
-        self._paused = False
+    async def _run(self):
+        if self.capture_path:
+            self.capture = CaptureWriter(self.capture_path)
+        await asyncio.gather(self._listen(), self._apply_loop())
 
     async def _listen(self):
 
@@ -49,22 +85,10 @@ class WebsocketClient:
                     self.status = True
                     logger.info("Websocket connected")
                     async for message in websocket:
-                        while self._paused:
-                            pass
+                        if self.capture is not None:
+                            self.capture.write(message)
                         try:
-                            message_json = json.loads(message)
-
-                            if message_json["type"] == "pixel":
-                                pixels = message_json["pixels"]
-                                for pixel in pixels:
-                                    if self.stats.board_array is not None:
-                                        self.stats.update_board_pixel(**pixel)
-                                    if self.stats.virginmap_array is not None:
-                                        self.stats.update_virginmap_pixel(**pixel)
-                            if message_json["type"] == "users":
-                                count = message_json["count"]
-                                self.stats.online_count = count
-
+                            self.handle_message(message)
                         except Exception:
                             logger.exception("Websocket client raised")
             except Exception as error:
@@ -73,3 +97,68 @@ class WebsocketClient:
                 logger.debug(f"Websocket disconnected: {error}")
                 logger.debug("Attempting reconnect...")
                 await asyncio.sleep(1)
+
+    def handle_message(self, message, now: int = None):
+        """Parse a websocket message and buffer its pixels or update the online count.
+        `now` is the unix timestamp of the message (default: current time)."""
+        message_json = json_loads(message)
+
+        if message_json["type"] == "pixel":
+            if now is None:
+                now = int(time.time())
+            for pixel in message_json["pixels"]:
+                self._pending_times.append(now)
+                self._pending_xs.append(pixel["x"])
+                self._pending_ys.append(pixel["y"])
+                self._pending_colors.append(pixel["color"])
+        if message_json["type"] == "users":
+            count = message_json["count"]
+            self.stats.online_count = count
+
+    async def _apply_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            try:
+                self.apply_pending_pixels()
+            except Exception:
+                logger.exception("Couldn't apply the pixels batch")
+            if self.capture is not None:
+                self.capture.flush()
+
+    def apply_pending_pixels(self) -> int:
+        """Apply all the buffered pixels on the boards in one batch.
+        Return the number of pixels applied."""
+        if not self._pending_xs:
+            return 0
+        times = np.array(self._pending_times, dtype=np.uint32)
+        xs = np.array(self._pending_xs, dtype=np.intp)
+        ys = np.array(self._pending_ys, dtype=np.intp)
+        # (negative colors wrap to 255: the transparent index)
+        colors = np.array(self._pending_colors, dtype=np.intp).astype(np.uint8)
+        self._pending_times = []
+        self._pending_xs = []
+        self._pending_ys = []
+        self._pending_colors = []
+
+        self.stats.update_pixels(xs, ys, colors)
+
+        canvas_code = self.stats.board_info.get("canvasCode")
+        if self.journal is not None and canvas_code is not None:
+            try:
+                self.journal.append(canvas_code, times, xs, ys, colors)
+            except Exception:
+                logger.exception("Couldn't write the pixels in the journal")
+
+        now = time.monotonic()
+        self.pixel_count += len(xs)
+        self._batch_history.append((now, len(xs)))
+        while self._batch_history[0][0] < now - THROUGHPUT_WINDOW:
+            self._batch_history.popleft()
+        return len(xs)
+
+    def get_throughput(self) -> float:
+        """Get the average number of pixels applied per second over the
+        last THROUGHPUT_WINDOW seconds."""
+        min_time = time.monotonic() - THROUGHPUT_WINDOW
+        nb_pixels = sum(n for t, n in list(self._batch_history) if t >= min_time)
+        return nb_pixels / THROUGHPUT_WINDOW
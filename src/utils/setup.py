@@ -6,11 +6,14 @@ from dotenv import load_dotenv
 from database.db_canvas_manager import DbCanvasManager
 from database.db_connection import DbConnection
 from database.db_servers_manager import DbServersManager
+from database.db_snapshot_manager import DbSnapshotManager
 from database.db_stats_manager import DbStatsManager
 from database.db_template_manager import DbTemplateManager
 from database.db_user_manager import DbUserManager
 from utils.image.imgur import Imgur
+from utils.pxls.pixel_journal import PixelJournal
 from utils.pxls.pxls_stats_manager import PxlsStatsManager
+from utils.pxls.template_cache import TemplateCache
 from utils.pxls.websocket_client import WebsocketClient
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
@@ -20,11 +23,16 @@ VERSION = "2.7.0"
 BOT_INVITE = os.getenv("BOT_INVITE")
 SERVER_INVITE = os.getenv("SERVER_INVITE")
 
+# folder where the bot saves its local data (pixel journal, ...)
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+
 # database connection
 db_conn = DbConnection()
 
 # connection with the pxls API
-stats = PxlsStatsManager(db_conn)
+# (PXLS_URL and PXLS_WS_URI can point the bot to another server,
+# like the local simulator in scripts/pxls_simulator.py)
+stats = PxlsStatsManager(db_conn, os.getenv("PXLS_URL", "https://pxls.space/"))
 
 # default prefix
 DEFAULT_PREFIX = ">"
@@ -35,10 +43,20 @@ db_servers = DbServersManager(db_conn, DEFAULT_PREFIX)
 db_users = DbUserManager(db_conn)
 db_templates = DbTemplateManager(db_conn)
 db_canvas = DbCanvasManager(db_conn)
+db_snapshots = DbSnapshotManager(db_conn)
+
+# journal of the pixels received by the websocket
+pixel_journal = PixelJournal(os.path.join(DATA_DIR, "journal"))
+
+# parsed template images saved on disk
+template_cache = TemplateCache(os.path.join(DATA_DIR, "templates"))
 
 # websocket
-uri = "wss://pxls.space/ws"
-ws_client = WebsocketClient(uri, stats)
+uri = os.getenv("PXLS_WS_URI", "wss://pxls.space/ws")
+# (PXLS_WS_CAPTURE is a file where the raw websocket frames are saved to replay them)
+ws_client = WebsocketClient(
+    uri, stats, journal=pixel_journal, capture_path=os.getenv("PXLS_WS_CAPTURE")
+)
 
 # guild IDs
 test_server_id = os.getenv("TEST_SERVER_ID")
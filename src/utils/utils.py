@@ -3,8 +3,10 @@ from __future__ import annotations
 import asyncio
 import base64
 import functools
+import json
 import re
 import timeit
+from collections import OrderedDict
 from typing import Awaitable, Callable, Optional, TypeVar
 
 import aiohttp
@@ -21,38 +23,116 @@ class BadResponseError(Exception):
     """Raised when response code isn't 200."""
 
 
-async def get_content(url: str, content_type, **kwargs):
+class HttpClient:
+    """A long-lived HTTP client sharing one connection pool between all the requests.
+
+    The responses with an ETag or a Last-Modified header are cached: the next
+    requests to the same URL send them as validators and the cached body is
+    reused when the server answers 304 (Not Modified)."""
+
+    def __init__(self, limit: int = 100, max_cache_size: int = 64 * 1024 * 1024):
+        self.limit = limit
+        self.max_cache_size = max_cache_size
+        self._session: aiohttp.ClientSession = None
+        # url -> (validators, content type, body)
+        self._cache: OrderedDict[str, tuple[dict, str, bytes]] = OrderedDict()
+        self._cache_size = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use"""
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=10.0, sock_read=10.0
+            )  # set a timeout of 10 seconds
+            connector = aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                timeout=timeout,
+                connector=connector,
+                # don't share cookies between the requests
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    def _uncache(self, url: str) -> None:
+        cached = self._cache.pop(url, None)
+        if cached:
+            self._cache_size -= len(cached[2])
+
+    def _cache_response(self, url, validators, content_type, body) -> None:
+        self._uncache(url)
+        if len(body) > self.max_cache_size // 4:
+            return
+        self._cache[url] = (validators, content_type, body)
+        self._cache_size += len(body)
+        while self._cache_size > self.max_cache_size:
+            _, (_, _, old_body) = self._cache.popitem(last=False)
+            self._cache_size -= len(old_body)
+
+    async def get(self, url: str, headers=None, cookies=None) -> tuple[int, str, bytes]:
+        """Send a GET request and return (status, content type, body),
+        the body is None if the status isn't 200."""
+        headers = dict(headers or {})
+        cached = self._cache.get(url)
+        if cached:
+            headers.update(cached[0])
+        async with self.session.get(url, headers=headers, cookies=cookies) as r:
+            if r.status == 304 and cached:
+                self._cache.move_to_end(url)
+                return 200, cached[1], cached[2]
+            if r.status != 200:
+                return r.status, r.headers.get("content-type", ""), None
+            body = await r.read()
+            content_type = r.headers.get("content-type", "")
+            validators = {}
+            if "ETag" in r.headers:
+                validators["If-None-Match"] = r.headers["ETag"]
+            if "Last-Modified" in r.headers:
+                validators["If-Modified-Since"] = r.headers["Last-Modified"]
+            if validators:
+                self._cache_response(url, validators, content_type, body)
+            else:
+                self._uncache(url)
+            return r.status, content_type, body
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+
+# HTTP client used by get_content
+http_client = HttpClient()
+
+
+async def get_content(url: str, content_type, headers=None, cookies=None):
     """Send a GET request to the url and return the response as json or bytes.
     Raise BadResponseError or ValueError."""
     # check if the URL is a data URL
     data = check_data_url(url)
     if data:
         return data
-    timeout = aiohttp.ClientTimeout(
-        sock_connect=10.0, sock_read=10.0
-    )  # set a timeout of 10 seconds
-    async with aiohttp.ClientSession(timeout=timeout, **kwargs) as session:
-        try:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    if content_type == "json":
-                        return await r.json()
-                    if content_type == "bytes":
-                        return await r.read()
-                    if content_type == "image":
-                        content_type = r.headers["content-type"]
-                        if "image" not in content_type:
-                            raise ValueError("The URL doesn't contain any image.")
-                        else:
-                            return await r.read()
-                else:
-                    raise BadResponseError(f"The URL leads to an error {r.status}")
-        except InvalidURL:
-            raise ValueError("The URL provided is invalid.")
-        except asyncio.TimeoutError:
-            raise ValueError("Couldn't connect to URL. (Timeout)")
-        except ClientConnectionError:
-            raise ValueError("Couldn't connect to URL.")
+    try:
+        status, response_type, body = await http_client.get(
+            url, headers=headers, cookies=cookies
+        )
+    except InvalidURL:
+        raise ValueError("The URL provided is invalid.")
+    except asyncio.TimeoutError:
+        raise ValueError("Couldn't connect to URL. (Timeout)")
+    except ClientConnectionError:
+        raise ValueError("Couldn't connect to URL.")
+    if status != 200:
+        raise BadResponseError(f"The URL leads to an error {status}")
+    if content_type == "json":
+        return json.loads(body)
+    if content_type == "bytes":
+        return body
+    if content_type == "image":
+        if "image" not in response_type:
+            raise ValueError("The URL doesn't contain any image.")
+        else:
+            return body
 
 
 def check_data_url(url):